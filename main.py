@@ -1,18 +1,32 @@
-"""The main routine for the secondorder app, to be run from the command line."""
+"""The main routine for the secondorder app, to be run from the command line.
 
+Without arguments, starts the GUI. With arguments, runs the headless batch
+mode instead (see secondorder.cli, or run: python main.py --help).
+"""
+import sys
 
-import tkinter as tk
 
-from secondorder.controller.controller import Controller
+def run_gui():
+    # tkinter is only imported here, so batch mode runs without a display
+    import tkinter as tk
 
-root = tk.Tk()
-root.title('secondorder')
-app = Controller(root)
+    from secondorder.controller.controller import Controller
 
-# workaround fix for Tk problems and mac mouse/trackpad:
-while True:
-    try:
-        root.mainloop()
-        break
-    except UnicodeDecodeError:
-        pass
+    root = tk.Tk()
+    root.title('secondorder')
+    app = Controller(root)
+
+    # workaround fix for Tk problems and mac mouse/trackpad:
+    while True:
+        try:
+            root.mainloop()
+            break
+        except UnicodeDecodeError:
+            pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        from secondorder.cli import main
+        sys.exit(main())
+    run_gui()
@@ -113,10 +113,13 @@ class SecondOrderSpinBar(SecondOrderBar):
     def __init__(self, parent=None,
                  from_=-10000, to=10000.00, increment=1, realtime=False,
                  **options):
+        # The controller's frame timer (if any) paces realtime refreshes
+        frame_timer = getattr(options.get('controller'), 'frame_timer', None)
         self.spinbox_kwargs = {'from_': from_,
                                'to': to,
                                'increment': increment,
-                               'realtime': realtime}
+                               'realtime': realtime,
+                               'frame_timer': frame_timer}
         SecondOrderBar.__init__(self, parent, **options)
 
     def add_frequency_widgets(self, n):
@@ -137,7 +140,8 @@ class SecondOrderSpinBar(SecondOrderBar):
                             name="W",
                             model=self.request_plot,
                             from_=0.01, to=100, increment=0.1,
-                            realtime=self.spinbox_kwargs['realtime'])
+                            realtime=self.spinbox_kwargs['realtime'],
+                            frame_timer=self.spinbox_kwargs['frame_timer'])
         wbox.pack(side=LEFT)
 
 
@@ -16,23 +16,114 @@ from matplotlib.figure import Figure
 
 
 class MPLgraph(FigureCanvasTkAgg):
-    def __init__(self, figure, master=None, **options):
+    def __init__(self, figure, master=None, on_xlim_changed=None,
+                 **options):
+        """
+        Arguments (in addition to FigureCanvasTkAgg arguments):
+            on_xlim_changed: optional function called with (xmin, xmax,
+            pixels) when the visible x range changes, e.g. by zooming or
+            panning with the toolbar
+        """
         FigureCanvasTkAgg.__init__(self, figure, master, **options)
         self.f = figure
         self.add = figure.add_subplot(111)
         self.add.invert_xaxis()
+        self.on_xlim_changed = on_xlim_changed
+        self.xlim_pending = False
+        self.connect_xlim()
+        # update_plot reuses one animated line, drawn over a saved copy of
+        # the rest of the figure (blitting)
+        self.line = None
+        self.background = None
+        self.mpl_connect('draw_event', self.on_draw)
         self.show()
         self.get_tk_widget().pack(side=TOP, fill=BOTH, expand=1)
         self.toolbar = NavigationToolbar2TkAgg(self, master)
         self.toolbar.update()
 
+    def connect_xlim(self):
+        # Axes.clear() discards callbacks, so this is repeated after it
+        self.add.callbacks.connect('xlim_changed', self.xlim_changed)
+
+    def xlim_changed(self, axes):
+        """Reports a new x range once Tk is idle, so that a burst of
+        changes (e.g. while panning) results in one re-render."""
+        if self.on_xlim_changed is not None and not self.xlim_pending:
+            self.xlim_pending = True
+            self.get_tk_widget().after_idle(self.report_xlim)
+
+    def report_xlim(self):
+        self.xlim_pending = False
+        xmin, xmax = self.add.get_xlim()
+        self.on_xlim_changed(xmin, xmax, self.plot_width())
+
+    def plot_width(self):
+        """Returns the width of the plot area in pixels."""
+        return max(1, int(self.add.bbox.width))
+
     def plot(self, x, y):
         self.add.plot(x, y)
         # apparently .draw_idle() gives faster refresh than .draw()
         self.f.canvas.draw_idle()  # DRAW IS CRITICAL TO REFRESH
 
+    def update_plot(self, x, y):
+        """Plots x, y in place of the previous update_plot data. The axes are
+        only rescaled (with a full redraw) if the data no longer fits them
+        well; otherwise only the line is redrawn."""
+        if self.line is None:
+            self.line, = self.add.plot(x, y, animated=True)
+            self.rescale()
+            return
+        self.line.set_data(x, y)
+        if self.needs_rescale(x, y):
+            self.rescale()
+        else:
+            self.blit_line()
+
+    def plot_window(self, x, y):
+        """Replaces the data of the plotted line, keeping the axis limits."""
+        if self.line is not None:
+            self.line.set_data(x, y)
+            self.blit_line()
+        elif self.add.lines:
+            self.add.lines[-1].set_data(x, y)
+            self.f.canvas.draw_idle()
+
+    def needs_rescale(self, x, y):
+        """Returns True if x, y extend beyond the axis limits, or fill less
+        than half of them."""
+        xmin, xmax = sorted(self.add.get_xlim())
+        ymin, ymax = sorted(self.add.get_ylim())
+        x_low, x_high, top = np.min(x), np.max(x), np.max(y)
+        return (x_low < xmin or x_high > xmax or top > ymax
+                or 2 * (x_high - x_low) < xmax - xmin
+                or 2 * (top - ymin) < ymax - ymin)
+
+    def rescale(self):
+        self.add.relim()
+        self.add.autoscale_view()
+        self.f.canvas.draw_idle()
+
+    def blit_line(self):
+        """Redraws only the line, over the background saved by on_draw."""
+        if self.background is None:
+            self.f.canvas.draw_idle()
+            return
+        self.restore_region(self.background)
+        self.add.draw_artist(self.line)
+        self.blit(self.add.bbox)
+
+    def on_draw(self, event):
+        """After a full draw (e.g. rescaling, resizing or zooming), saves the
+        figure without the animated line, then draws the line."""
+        self.background = self.copy_from_bbox(self.add.bbox)
+        if self.line is not None:
+            self.add.draw_artist(self.line)
+
     def clear(self):
         self.add.clear()
+        self.line = None
+        self.connect_xlim()
         self.f.canvas.draw()
 
 
@@ -80,7 +171,9 @@ class View(Frame):
 
     def add_plot(self):
         self.figure = Figure(figsize=(5, 4), dpi=100)
-        self.canvas = MPLgraph(self.figure, self)
+        self.canvas = MPLgraph(
+            self.figure, self,
+            on_xlim_changed=self.controller.update_view_window)
         self.canvas._tkcanvas.pack(anchor=SE, expand=YES, fill=BOTH)
         Button(self, text="clear", command=lambda: self.canvas.clear()).pack(
             side=BOTTOM)
@@ -122,6 +215,29 @@ class View(Frame):
         """
         self.canvas.plot(x, y)
 
+    def update_plot(self, x, y):
+        """Replace the plotted lineshape with x, y (see MPLgraph.update_plot).
+        Faster than clear() followed by plot().
+
+        Arguments:
+            x, y: numpy arrays of x and y coordinates
+        """
+        self.canvas.update_plot(x, y)
+
+    def plot_window(self, x, y):
+        """Replace the plotted data with a lineshape for the visible x range
+        (see Controller.update_view_window), keeping the axis limits.
+
+        Arguments:
+            x, y: numpy arrays of x and y coordinates
+        """
+        self.canvas.plot_window(x, y)
+
+    def plot_width(self):
+        """Return the width of the plot area in pixels, the resolution that
+        lineshapes are rendered at."""
+        return self.canvas.plot_width()
+
 
 if __name__ == '__main__':
     # Create the main application window:
@@ -1,7 +1,50 @@
 """Custom widgets composed from standard tkinter widgets"""
+import threading
+from collections import deque
 from tkinter import *
 
 
+class FrameTimer:
+    """
+    Keeps the durations of recent frames (a simulation plus drawing its
+    plot), for scheduling realtime refreshes.
+
+    A refresh requested while the previous frame is still being computed
+    only replaces the pending request (see controller.worker), so refreshing
+    more often than frames can be finished adds work without reducing the
+    delay before the newest value is shown. interval() therefore follows the
+    recent frame time, between a minimum (the fastest useful repeat rate)
+    and the target latency.
+
+    Arguments:
+        minimum: shortest refresh interval, in ms
+        target: longest refresh interval, in ms, to keep the shown spectrum
+                close to the newest spinbox value when frames are slow
+        window: number of recent frames averaged
+    """
+    def __init__(self, minimum=50, target=250, window=8):
+        self.minimum = minimum
+        self.target = target
+        self.times = deque(maxlen=window)
+        self.lock = threading.Lock()  # frames are timed on two threads
+
+    def record(self, seconds):
+        """Records the duration of one frame, in seconds."""
+        with self.lock:
+            self.times.append(seconds)
+
+    def frame_time(self):
+        """Returns the average recent frame time in ms (0 if none)."""
+        with self.lock:
+            if not self.times:
+                return 0
+            return 1000 * sum(self.times) / len(self.times)
+
+    def interval(self):
+        """Returns the refresh interval in ms."""
+        return int(min(max(self.minimum, self.frame_time()), self.target))
+
+
 class EntryFrame(Frame):
     """
     A tkinter Frame that holds a labeled entry widget with added behavior.
@@ -185,11 +228,14 @@ class ArraySpinBox(ArrayBox):
                               and incremental change on each arrow click)
         realtime: True if data/model should be refreshed as the SpinBox arrow
                   button is held down.
+        frame_timer: a FrameTimer whose interval() sets the realtime refresh
+                     rate, or None to refresh every 50 ms.
     """
     def __init__(self, parent=None, from_=0.00, to=100.00, increment=1,
-                 realtime=False,
+                 realtime=False, frame_timer=None,
                  **options):
         self.realtime = realtime
+        self.frame_timer = frame_timer
         self.spinbox_kwargs = {'from_': from_,
                                'to': to,
                                'increment': increment}
@@ -220,7 +266,14 @@ class ArraySpinBox(ArrayBox):
 
     def loop_refresh(self):
         self.refresh()
-        self.button_held_job = self._root().after(50, self.loop_refresh)
+        self.button_held_job = self._root().after(self.refresh_interval(),
+                                                  self.loop_refresh)
+
+    def refresh_interval(self):
+        """Returns the time in ms until the next realtime refresh."""
+        if self.frame_timer is None:
+            return 50
+        return self.frame_timer.interval()
 
     def on_release(self):
         if self.realtime:
@@ -0,0 +1,7 @@
+"""Runs the headless batch mode: python -m secondorder --help"""
+import sys
+
+from secondorder.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
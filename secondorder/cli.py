@@ -0,0 +1,340 @@
+"""
+Headless batch mode for secondorder, for use in pipelines on machines
+without a display.
+
+Spin systems are read as JSON Lines, one object per line:
+
+    {"id": "ethyl", "v": [120, 250], "j": [[0, 7], [7, 0]], "w": 0.5}
+
+where "id" (optional) is copied to the output, "v" is the list of
+frequencies in Hz, "j" the coupling matrix in Hz, "w" (optional, default
+0.5) the line width, which must be positive, and "simulation" (optional)
+is 'QM' (default), 'FO' or 'auto' (see Controller.update_with_dict).
+
+For each system, one JSON line is written, in input order: {"id": ...,
+"peaks": [[frequency, intensity], ...]}, or with --lineshape {"id": ...,
+"x": [...], "y": [...]}. A system that cannot be simulated gives {"id":
+..., "line": ..., "error": ...} instead.
+
+With --bulk DIR, peak lists and lineshapes (of --points points, default
+2400) are appended to a memory-mapped bulk store instead (see
+model.bulk.BulkWriter), and each output line only gives the system's row:
+{"id": ..., "row": ...}. Systems without an "id" are stored under
+"line:<line number>". The store's index is flushed every --flush-every
+rows (default 1000), so readers can follow the results as they come in.
+
+Systems are simulated on a pool of worker processes. At most --in-flight
+systems are read ahead of the output, so memory use does not grow with the
+size of the input. Memory use per system grows exponentially with the
+number of coupled spins, so systems with a cluster of more than
+--max-cluster coupled spins (default 14) are rejected, and a system that
+runs out of memory, or whose worker process is killed, gives an error line
+instead of stopping the run.
+
+Usage:
+    python -m secondorder systems.jsonl -o spectra.jsonl --workers 8
+    python -m secondorder systems.jsonl --bulk campaign/ > rows.jsonl
+    cat systems.jsonl | python -m secondorder --lineshape > lineshapes.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from contextlib import nullcontext
+from functools import partial
+
+import numpy as np
+
+from secondorder.model.bulk import BulkWriter
+from secondorder.model.firstorder import SIMULATIONS, strong_coupling_groups
+from secondorder.model.nmrmath import spin_clusters
+from secondorder.model.nmrplot import tkplot
+from secondorder.model.parallel import (START_METHOD, blas_environment,
+                                        initialize_worker)
+from secondorder.model.store import SpectrumStore
+
+# One SpectrumStore per directory in each process, so that its running size
+# estimate is kept from one record to the next (see SpectrumStore)
+_stores = {}
+
+
+def spectrum_store(directory):
+    """Returns this process's SpectrumStore for directory."""
+    store = _stores.get(directory)
+    if store is None:
+        store = _stores[directory] = SpectrumStore(directory)
+    return store
+
+
+def simulate_record(record, lineshape=False, pixels=2400, points=None,
+                    store=None, arrays=False, max_cluster=None):
+    """
+    Simulates one spin system.
+
+    :param record: a dict with "v", "j" and optional "id", "w" and
+    "simulation" entries (see the module documentation)
+    :param lineshape: return the x, y lineshape instead of the peak list
+    :param pixels, points: lineshape grid options (see nmrplot.tkplot)
+    :param store: directory of a SpectrumStore used for 'QM' peak lists, or
+    None
+    :param arrays: return the peaks and lineshape as numpy arrays instead
+    of lists
+    :param max_cluster: largest number of spins simulated together ('QM':
+    coupled spins, 'auto': strongly coupled spins), or None for no limit
+    :returns: the output dict
+    """
+    v = np.asarray(record['v'], dtype=float).ravel()
+    j = np.asarray(record['j'], dtype=float)
+    if j.shape != (len(v), len(v)):
+        raise ValueError('j must be a {0} x {0} matrix'.format(len(v)))
+    if not (np.isfinite(v).all() and np.isfinite(j).all()):
+        raise ValueError('v and j must be finite')
+    w = float(record.get('w', 0.5))
+    if not (np.isfinite(w) and w > 0):
+        raise ValueError('w must be a positive number')
+    simulation = record.get('simulation', 'QM')
+    if simulation not in SIMULATIONS:
+        raise ValueError('unknown simulation: {!r}'.format(simulation))
+    if max_cluster is not None and simulation != 'FO':
+        clusters = (spin_clusters(j) if simulation == 'QM'
+                    else strong_coupling_groups(v, j))
+        largest = max((len(cluster) for cluster in clusters), default=0)
+        if largest > max_cluster:
+            raise ValueError('{} coupled spins; at most {} can be simulated '
+                             'together'.format(largest, max_cluster))
+
+    if simulation == 'QM' and store is not None:
+        peaklist = spectrum_store(store).nspinspec(v, j)
+    else:
+        peaklist = SIMULATIONS[simulation](v, j)
+
+    result = {'id': record.get('id')}
+    if lineshape:
+        x, y = tkplot(list(peaklist), w, pixels=pixels, points=points)
+        result['x'] = x if arrays else x.tolist()
+        result['y'] = y if arrays else y.tolist()
+    if arrays:
+        result['peaks'] = np.array(peaklist, dtype=float).reshape(-1, 2)
+    else:
+        result['peaks'] = [[float(frequency), float(intensity)]
+                           for frequency, intensity in peaklist]
+    return result
+
+
+def process_line(task, bulk=False, **options):
+    """
+    Parses and simulates one line of input (run in the worker processes).
+
+    :param task: (line number, line) tuple
+    :param bulk: return the result for a BulkWriter: the simulate_record
+    dict with numpy arrays, with "line:<line number>" as id if there is none
+    :param options: keyword arguments for simulate_record
+    :returns: (output line, error) tuple; error is None on success
+    """
+    number, line = task
+    record = {}
+    try:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError('expected a JSON object')
+        result = simulate_record(record, arrays=bulk, **options)
+    except (ValueError, KeyError, TypeError, MemoryError,
+            np.linalg.LinAlgError) as e:
+        return error_line(number, record, e)
+    if bulk:
+        if result['id'] is None:
+            result['id'] = 'line:{}'.format(number)
+        return result, None
+    return json.dumps(result), None
+
+
+def error_line(number, record, exception):
+    """Returns the (output line, error) tuple for an input line that could
+    not be simulated."""
+    error = '{}: {}'.format(type(exception).__name__, exception)
+    result = {'id': record.get('id') if isinstance(record, dict) else None,
+              'line': number,
+              'error': error}
+    return json.dumps(result), error
+
+
+def worker_died(task, exception):
+    """Returns the (output line, error) tuple for a task whose worker process
+    died (see bounded_map)."""
+    number, line = task
+    try:
+        record = json.loads(line)
+    except ValueError:
+        record = None
+    return error_line(number, record, exception)
+
+
+def read_tasks(lines):
+    """Yields (line number, line) tuples of the non-blank, non-comment
+    lines."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def bounded_map(start_executor, function, iterable, in_flight, on_error):
+    """Like ProcessPoolExecutor.map, but only submits up to in_flight items
+    ahead of the result being waited for, instead of the whole iterable at
+    once. Results are yielded in input order.
+
+    start_executor() is called to start the process pool, and again if a
+    worker process dies (e.g. killed for using too much memory), which
+    breaks the pool. The items that were in flight are then run again one
+    at a time, so that only an item that kills its worker gives
+    on_error(item, error) instead of its result.
+    """
+    executor = start_executor()
+    futures = deque()  # (item, future) pairs
+
+    def submit(item):
+        try:
+            return executor.submit(function, item)
+        except BrokenProcessPool as e:  # found broken since the last result
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def results(count):
+        # Yields results until at most count items are in flight
+        nonlocal executor
+        while len(futures) > count:
+            item, future = futures.popleft()
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                retry = [item] + [item for item, _ in futures]
+                futures.clear()
+            else:
+                yield result
+                continue
+            executor.shutdown()
+            executor = start_executor()
+            for item in retry:
+                try:
+                    result = executor.submit(function, item).result()
+                except BrokenProcessPool as e:
+                    yield on_error(item, e)
+                    executor.shutdown()
+                    executor = start_executor()
+                else:
+                    yield result
+
+    try:
+        for item in iterable:
+            yield from results(in_flight - 1)
+            futures.append((item, submit(item)))
+        yield from results(0)
+    finally:
+        executor.shutdown()
+
+
+def store_result(writer, result):
+    """Appends a process_line(bulk=True) result to a BulkWriter.
+
+    Returns: (output line, error) tuple, as from process_line.
+    """
+    try:
+        row = writer.append(result['id'], result['peaks'], result['x'],
+                            result['y'])
+    except (ValueError, TypeError) as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+        return json.dumps({'id': result['id'], 'error': error}), error
+    return json.dumps({'id': result['id'], 'row': row}), None
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='secondorder',
+        description='Simulates NMR spectra of spin systems read as JSON '
+                    'Lines, without the GUI.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='JSON Lines file of spin systems '
+                             '(default: standard input)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='output file (default: standard output)')
+    parser.add_argument('--lineshape', action='store_true',
+                        help='write x, y lineshapes instead of peak lists')
+    parser.add_argument('--pixels', type=int, default=2400,
+                        help='maximum lineshape points per spectrum width, '
+                             'before points added around narrow peaks')
+    parser.add_argument('--points', type=int, default=None,
+                        help='fixed number of evenly spaced lineshape '
+                             'points')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: number of CPUs; '
+                             '0 simulates in this process)')
+    parser.add_argument('--max-cluster', type=int, default=14,
+                        help='largest number of coupled spins simulated '
+                             'together; larger systems are rejected '
+                             '(default: 14)')
+    parser.add_argument('--in-flight', type=int, default=None,
+                        help='maximum systems read ahead of the output '
+                             '(default: 4 per worker)')
+    parser.add_argument('--store', default=None,
+                        help='directory of an on-disk cache of QM peak '
+                             'lists (see model.store.SpectrumStore)')
+    parser.add_argument('--bulk', default=None,
+                        help='write peak lists and lineshapes to this '
+                             'memory-mapped bulk store directory (see '
+                             'model.bulk) instead of the output')
+    parser.add_argument('--flush-every', type=int, default=1000,
+                        help='rows between flushes of the bulk store index '
+                             '(default: 1000)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the batch mode. Returns the exit status: 0 if every system was
+    simulated, 1 otherwise."""
+    args = parse_arguments(argv)
+    workers = os.cpu_count() if args.workers is None else args.workers
+    in_flight = args.in_flight or 4 * max(1, workers)
+    bulk = args.bulk is not None
+    points = (args.points or 2400) if bulk else args.points
+    function = partial(process_line, lineshape=args.lineshape or bulk,
+                       pixels=args.pixels, points=points, store=args.store,
+                       max_cluster=args.max_cluster, bulk=bulk)
+
+    source = (nullcontext(sys.stdin) if args.input == '-'
+              else open(args.input))
+    target = (nullcontext(sys.stdout) if args.output == '-'
+              else open(args.output, 'w'))
+    writer = (BulkWriter(args.bulk, points=points,
+                         flush_every=args.flush_every) if bulk
+              else nullcontext())
+    failures = 0
+    with source as lines, target as out, writer:
+        tasks = read_tasks(lines)
+        if workers == 0:
+            results = map(function, tasks)
+            limits = nullcontext()
+        else:
+            # one BLAS thread per worker; workers start on the first submit
+            limits = blas_environment(1)
+            start_executor = partial(ProcessPoolExecutor, workers,
+                                     mp_context=get_context(START_METHOD),
+                                     initializer=initialize_worker,
+                                     initargs=(1,))
+            results = bounded_map(start_executor, function, tasks, in_flight,
+                                  worker_died)
+        with limits:
+            for text, error in results:
+                if bulk and error is None:
+                    text, error = store_result(writer, text)
+                out.write(text + '\n')
+                if error is not None:
+                    failures += 1
+                    print('secondorder: ' + error, file=sys.stderr)
+        out.flush()
+    return 1 if failures else 0
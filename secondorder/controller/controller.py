@@ -8,11 +8,19 @@ Contains:
 * Controller    Class that handles data and requests to/from the model and 
                 the view.
 """
+import threading
+import time
 import tkinter as tk
 
 from secondorder.GUI.view import View
-from secondorder.model.nmrmath import nspinspec
+from secondorder.GUI.widgets import FrameTimer
+from secondorder.controller.worker import SimulationWorker
+from secondorder.model.cache import LRUCache, spectrum_key
+from secondorder.model.firstorder import SIMULATIONS
+from secondorder.model.nmrmath import (equivalent_groups, nspinspec,
+                                        spin_clusters)
 from secondorder.model.nmrplot import tkplot
+from secondorder.model.spinsystem import SpinSystem
 
 
 class Controller:
@@ -27,19 +35,63 @@ class Controller:
     * clear()--clears the view's plot.
     
     * plot(x, y)--accept a tuple of x, y numpy arrays and plot the data.
+
+    * update_plot(x, y)--replace the plotted data with x, y.
+
+    * plot_window(x, y)--replace the plotted data with a lineshape for the
+    visible x range, without changing the axis limits.
+
+    * plot_width()--return the width of the plot in pixels.
     
+    Simulations, and the re-rendering of zoomed views, run on background
+    threads (see worker.SimulationWorker), so the view stays responsive;
+    only the newest pending request is simulated, and its lineshape is
+    plotted from the Tk thread.
+
     The controller provides the following methods:
     
     * update_view_plot: accepts a tuple of simulation name (string) and 
     variables; calls the appropriate model simulation with the variables; 
     and tells the view to plot the data the model returns.
+
+    * simulate: returns the (x, y) lineshape for a set of variables, from
+    the controller's LRU caches if the same request was made before.
+
+    * update_view_window: called by the view when the visible x range
+    changes (e.g. zooming); re-renders the lineshape for that range at
+    screen resolution.
     """
-    def __init__(self, root):
+    def __init__(self, root, cache_size=64):
         """Instantiates the view as a child of root, and then initializes it.
         
         Argument:
             root: a tkinter.Tk() object
+            cache_size: number of peak lists, and of lineshapes, kept in
+            the in-memory caches
         """
+        # Peak lists are keyed without w, so a line width change reuses them
+        self.peak_cache = LRUCache(cache_size)
+        self.plot_cache = LRUCache(cache_size)
+        # Lineshapes of zoomed views, keyed by request and x range
+        self.window_cache = LRUCache(cache_size)
+        # (v, j, w, simulation, pixels, x range) of the plotted spectrum
+        self.displayed = None
+        # False while the line holds (or is about to hold) a zoomed window
+        # instead of the full lineshape
+        self.showing_full = True
+        # One incrementally updated SpinSystem per number of spins, so that
+        # a change to one variable does not rebuild the Hamiltonian, and
+        # small changes reuse the previous eigenvectors
+        self.spinsystems = {}
+        self.spinsystem_lock = threading.Lock()
+        self.warm_start_tolerance = 0.01
+        self.worker = SimulationWorker(root, self.render, self.show)
+        # Zoomed views are rendered on their own thread, so that a zoom
+        # does not wait for a simulation in progress, or replace it
+        self.window_worker = SimulationWorker(root, self.render_window,
+                                              self.show_window)
+        # Simulation plus draw times, which pace realtime spinbox refreshes
+        self.frame_timer = FrameTimer()
 
         self.view = View(root, self)
         self.view.pack(expand=tk.YES, fill=tk.BOTH)
@@ -58,17 +110,173 @@ class Controller:
             separation of concerns, however.
         """
         v, j, w = data
-        plotdata = tkplot(nspinspec(v, j), w)
-        self.view.clear()
-        self.view.plot(*plotdata)
+        # the view's arrays change while the worker uses them
+        self.worker.submit(v.copy(), j.copy(), w, 'QM',
+                           self.view.plot_width())
+
+    def render(self, v, j, w, simulation='QM', pixels=2400):
+        """Returns a ((x, y), seconds) tuple of the lineshape for a request
+        and the time taken to simulate it. Called on the worker thread."""
+        start = time.perf_counter()
+        _, plotdata = self.simulate(v, j, w, simulation, pixels)
+        return plotdata, time.perf_counter() - start
+
+    def show(self, rendered, v, j, w, simulation='QM', pixels=2400):
+        """Plots a lineshape returned by render, records the request so
+        that zoomed views can be re-rendered, and records the frame time.
+        Called on the Tk thread."""
+        plotdata, simulation_time = rendered
+        start = time.perf_counter()
+        x, _ = plotdata
+        self.displayed = (v, j, w, simulation, pixels, (x[0], x[-1]))
+        self.showing_full = True
+        self.view.update_plot(*plotdata)
+        self.frame_timer.record(simulation_time
+                                + time.perf_counter() - start)
+
+    def simulate(self, v, j, w, simulation='QM', pixels=2400):
+        """Returns the lineshape for a simulation, using cached results for
+        repeated requests.
+
+        Arguments:
+            v, j, w, simulation: see update_with_dict
+            pixels: the width of the plot in pixels (see nmrplot.tkplot)
+        Returns: (key, (x, y)) tuple, where key identifies the request (the
+        canonical hash of the simulation, and pixels) and x, y are numpy
+        arrays of the lineshape.
+        """
+        key = (spectrum_key(v, j, w, simulation), pixels)
+        plotdata = self.plot_cache.get(key)
+        if plotdata is None:
+            peaklist, exact = self.peaklist(v, j, simulation)
+            plotdata = tkplot(list(peaklist), w, pixels=pixels)
+            if exact:
+                self.plot_cache.put(key, plotdata)
+        return key, plotdata
+
+    def simulate_window(self, v, j, w, limits, pixels, simulation='QM'):
+        """Returns the lineshape for a simulation over the x range limits
+        only, at the resolution of a plot pixels wide, using cached results
+        for repeated windows.
+
+        Returns: (x, y) tuple of numpy arrays.
+        """
+        key = (spectrum_key(v, j, w, simulation), tuple(sorted(limits)),
+               pixels)
+        plotdata = self.window_cache.get(key)
+        if plotdata is None:
+            peaklist, exact = self.peaklist(v, j, simulation)
+            plotdata = tkplot(list(peaklist), w, pixels=pixels,
+                              limits=limits)
+            if exact:
+                self.window_cache.put(key, plotdata)
+        return plotdata
+
+    def peaklist(self, v, j, simulation='QM'):
+        """Returns the peak list for a simulation, from the peak list cache
+        if possible. Peak lists do not depend on w, so a line width change
+        reuses them.
+
+        Returns: (peaklist, exact) tuple. exact is False for a peak list
+        from a warm-started (approximate) SpinSystem solve; such peak lists,
+        and lineshapes made from them, are not cached, so that a later
+        request for the same variables gets the exact result.
+        """
+        peaks_key = spectrum_key(v, j, None, simulation)
+        peaklist = self.peak_cache.get(peaks_key)
+        if peaklist is not None:
+            return peaklist, True
+        if simulation == 'QM':
+            peaklist, exact = self.spinsystem_spectrum(v, j)
+        else:
+            peaklist, exact = SIMULATIONS[simulation](v, j), True
+        if exact:
+            self.peak_cache.put(peaks_key, peaklist)
+        return peaklist, exact
+
+    def spinsystem_spectrum(self, v, j):
+        """Returns the quantum-mechanical peak list for v and j.
+
+        A SpinSystem solves all the spins together, so it is only used for a
+        single cluster of coupled spins without magnetically equivalent
+        nuclei; it is then updated with only the variables that changed
+        since the last request. Otherwise nspinspec simulates the clusters
+        separately, and equivalent nuclei as composite particles, which
+        costs less than a full solve.
+
+        Returns: (peaklist, exact) tuple; exact is False if any Mz block was
+        solved from the previous eigenvectors (see SpinSystem).
+        """
+        if (len(spin_clusters(j)) > 1
+                or len(equivalent_groups(v, j)) < len(v)):
+            return nspinspec(v, j), True
+        with self.spinsystem_lock:  # used by the worker and Tk threads
+            system = self.spinsystems.get(len(v))
+            if system is None:
+                system = SpinSystem(v, j,
+                                    tolerance=self.warm_start_tolerance)
+                self.spinsystems[len(v)] = system
+            else:
+                system.update(v, j)
+            warm_solves = system.warm_solves
+            peaklist = system.spectrum()
+            return peaklist, system.warm_solves == warm_solves
+
+    def cache_stats(self):
+        """Returns the statistics of the peak list and lineshape caches, as
+        a dict of LRUCache.stats() dicts."""
+        return {'peaks': self.peak_cache.stats(),
+                'plots': self.plot_cache.stats(),
+                'windows': self.window_cache.stats()}
+
+    def update_view_window(self, xmin, xmax, pixels):
+        """Called by the view when its visible x range changes. Requests a
+        re-render of the plotted spectrum for xmin..xmax at screen
+        resolution. If the range shows the whole spectrum (e.g. after
+        zooming out), the full lineshape is plotted again, unless it is
+        already. Rendering runs on a background thread (see render_window).
+
+        Arguments:
+            xmin, xmax: the visible x range
+            pixels: the width of the plot in pixels
+        """
+        if self.displayed is None:
+            return
+        v, j, w, simulation, full_pixels, (left, right) = self.displayed
+        xmin, xmax = sorted((xmin, xmax))
+        if xmin <= left and xmax >= right:
+            if not self.showing_full:
+                self.showing_full = True
+                self.window_worker.submit(self.displayed, None, full_pixels)
+            return
+        self.showing_full = False
+        self.window_worker.submit(self.displayed, (xmin, xmax), pixels)
+
+    def render_window(self, displayed, limits, pixels):
+        """Returns the lineshape of the displayed spectrum over the x range
+        limits, or the full lineshape if limits is None. Called on the
+        window worker's thread."""
+        v, j, w, simulation = displayed[:4]
+        if limits is None:
+            _, plotdata = self.simulate(v, j, w, simulation, pixels)
+            return plotdata
+        return self.simulate_window(v, j, w, limits, pixels, simulation)
+
+    def show_window(self, plotdata, displayed, limits, pixels):
+        """Plots a lineshape returned by render_window, unless a different
+        spectrum has been plotted since it was requested. Called on the Tk
+        thread."""
+        if displayed is self.displayed:
+            self.view.plot_window(*plotdata)
 
     def update_with_dict(self, v, j, w, simulation='QM', **kwargs):
         """Test version of update_view_plot using **kwargs, not *args.
 
         Keyword arguments:
-            Simulation: currently only QM for second-order quantum-mechanical
-            calculation (second order). Future expansion may allow 'FO' for
-            first-order simulations as well.
+            Simulation: 'QM' for second-order quantum-mechanical
+            calculation (second order), 'FO' for a first-order
+            simulation, or 'auto' to treat only strongly coupled nuclei
+            quantum-mechanically (see model.firstorder.auto_signals).
             v: a 1-D numpy array of frequencies
             j: a 2-D numpy array of coupling constants (J values)
             w: line width at half height
@@ -83,9 +291,9 @@ class Controller:
             if not w.any():
                 print('w missing')
         else:
-            plotdata = tkplot(nspinspec(v, j), w)
-            self.view.clear()
-            self.view.plot(*plotdata)
+            # the view's arrays change while the worker uses them
+            self.worker.submit(v.copy(), j.copy(), w, simulation,
+                               self.view.plot_width())
 
 if __name__ == '__main__':
     root = tk.Tk()
@@ -0,0 +1,124 @@
+"""
+A background thread for the simulations requested by the GUI.
+
+Tk is not thread-safe, so the worker thread never touches widgets: finished
+results are handed back to the Tk main loop, which polls for them with
+after().
+
+Contains:
+
+* SimulationWorker  Runs the newest pending request on a background thread,
+                    dropping requests that were superseded before they
+                    started.
+"""
+import threading
+
+
+class SimulationWorker:
+    """Runs requests one at a time on a background thread, keeping only the
+    newest pending request.
+
+    While a request is being computed, newer requests replace each other, so
+    a burst of requests (e.g. while a spinbox arrow is held down) costs at
+    most one computation beyond the one in progress, and the last result
+    delivered is always for the newest request.
+
+    Example:
+        worker = SimulationWorker(root, simulate, show)
+        worker.submit(v, j, w)  # later, show(simulate(v, j, w), v, j, w)
+                                # is called on the Tk thread
+    """
+    def __init__(self, widget, function, callback, interval=10):
+        """
+        Arguments:
+            widget: any tkinter widget; its after() method schedules the
+            polls for results on the Tk thread
+            function: called on the worker thread with the arguments of
+            submit(); returns the result
+            callback: called on the Tk thread as callback(result, *args,
+            **kwargs) with the result of the newest finished request
+            interval: time in ms between polls while requests are running
+        """
+        self.widget = widget
+        self.function = function
+        self.callback = callback
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.pending = None  # (args, kwargs) of the newest unstarted request
+        self.finished = None  # (args, kwargs, result, error) to deliver
+        self.busy = False
+        self.polling = False
+        self.closed = False
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.thread = threading.Thread(target=self.run,
+                                       name='secondorder-simulation',
+                                       daemon=True)
+        self.thread.start()
+
+    def submit(self, *args, **kwargs):
+        """Requests function(*args, **kwargs), replacing any request that
+        has not started yet. Must be called from the Tk thread. Arguments
+        are used after submit returns, so mutable arguments that the caller
+        may change (e.g. arrays bound to widgets) should be copies."""
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (args, kwargs)
+            self.submitted += 1
+            self.condition.notify()
+        if not self.polling:
+            self.polling = True
+            self.widget.after(self.interval, self.poll)
+
+    def run(self):
+        """The worker thread's loop."""
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                args, kwargs = self.pending
+                self.pending = None
+                self.busy = True
+            result, error = None, None
+            try:
+                result = self.function(*args, **kwargs)
+            except Exception as e:
+                error = e
+            with self.condition:
+                self.busy = False
+                self.completed += 1
+                self.finished = (args, kwargs, result, error)
+
+    def poll(self):
+        """Delivers the newest finished result, if any, on the Tk thread,
+        and keeps polling while requests are pending or running."""
+        with self.condition:
+            finished, self.finished = self.finished, None
+            active = self.busy or self.pending is not None
+        if active and not self.closed:
+            self.widget.after(self.interval, self.poll)
+        else:
+            self.polling = False
+        if finished is not None:
+            args, kwargs, result, error = finished
+            if error is not None:
+                raise error  # reported by Tk like any callback error
+            self.callback(result, *args, **kwargs)
+
+    def idle(self):
+        """Returns True if no request is pending, running or undelivered."""
+        with self.condition:
+            return not (self.busy or self.pending is not None
+                        or self.finished is not None)
+
+    def close(self, timeout=None):
+        """Stops the worker thread after the request in progress."""
+        with self.condition:
+            self.closed = True
+            self.pending = None
+            self.condition.notify()
+        self.thread.join(timeout)
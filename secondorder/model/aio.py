@@ -0,0 +1,122 @@
+"""
+Coroutine versions of the simulation -> lineshape pipeline, for use in
+asyncio applications (e.g. a service with many concurrent clients).
+
+The heavy stages (the simulation, and rendering the lineshape) run in an
+executor, so the event loop is never blocked. A semaphore limits how many
+stages run at once, and each client session has at most one request in
+progress: a newer request for the same session cancels the older one.
+
+Contains:
+
+* AsyncSimulator  Runs simulations and lineshapes in an executor, with
+                  per-session cancellation and a shared peak list cache.
+"""
+
+import asyncio
+import os
+from functools import partial
+
+from secondorder.model.cache import LRUCache, spectrum_key
+from secondorder.model.firstorder import SIMULATIONS
+from secondorder.model.nmrplot import tkplot
+
+
+class AsyncSimulator:
+    """Runs simulations in an executor from coroutines.
+
+    Example:
+        simulator = AsyncSimulator(max_concurrent=4)
+        x, y = await simulator.lineshape(v, j, 0.5, session=client_id)
+
+    A request that is superseded by a newer one for the same session raises
+    asyncio.CancelledError in its caller. Requests without a session are
+    never cancelled by other requests.
+    """
+    def __init__(self, max_concurrent=None, executor=None, cache_size=128):
+        """
+        Arguments:
+            max_concurrent: maximum number of stages running in the executor
+            at once (default: number of CPUs)
+            executor: a concurrent.futures executor, or None for the event
+            loop's default thread pool (numpy releases the GIL in its
+            eigensolvers, so threads run simulations in parallel)
+            cache_size: number of peak lists kept, shared by all sessions
+        """
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.executor = executor
+        self.peak_cache = LRUCache(cache_size)
+        self.sessions = {}  # session -> task of its newest request
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created on first use, inside the event loop that uses it
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def run(self, function, *args, **kwargs):
+        """Runs function(*args, **kwargs) in the executor once a semaphore
+        slot is free.
+
+        A running function cannot be interrupted, so if the caller is
+        cancelled, the slot stays taken until the function returns.
+        """
+        await self.semaphore.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, partial(function, *args, **kwargs))
+        except BaseException:
+            self.semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self.semaphore.release())
+        return await asyncio.shield(future)
+
+    async def peaklist(self, v, j, simulation='QM', session=None):
+        """Returns the peak list (a list of (frequency, intensity) tuples) for
+        a simulation: 'QM', 'FO' or 'auto' (see Controller.update_with_dict).
+        """
+        return await self.latest(session, self._peaklist(v, j, simulation))
+
+    async def lineshape(self, v, j, w, simulation='QM', session=None,
+                        **plot_options):
+        """Returns the (x, y) lineshape of a simulation with line width w.
+
+        Keyword arguments:
+            plot_options: pixels, points or limits (see nmrplot.tkplot)
+        """
+        return await self.latest(
+            session, self._lineshape(v, j, w, simulation, plot_options))
+
+    def cancel(self, session):
+        """Cancels the request in progress for session, if any."""
+        task = self.sessions.pop(session, None)
+        if task is not None:
+            task.cancel()
+
+    async def latest(self, session, coroutine):
+        """Awaits coroutine as the newest request of session, cancelling the
+        session's previous request."""
+        if session is None:
+            return await coroutine
+        self.cancel(session)
+        task = asyncio.ensure_future(coroutine)
+        self.sessions[session] = task
+        try:
+            return await task
+        finally:
+            if self.sessions.get(session) is task:
+                del self.sessions[session]
+
+    async def _peaklist(self, v, j, simulation):
+        key = spectrum_key(v, j, None, simulation)
+        peaklist = self.peak_cache.get(key)
+        if peaklist is None:
+            peaklist = await self.run(SIMULATIONS[simulation], v, j)
+            self.peak_cache.put(key, peaklist)
+        return peaklist
+
+    async def _lineshape(self, v, j, w, simulation, plot_options):
+        peaklist = await self._peaklist(v, j, simulation)
+        return await self.run(tkplot, list(peaklist), w, **plot_options)
@@ -0,0 +1,102 @@
+"""
+Batched simulation of many spin systems with the same number of nuclei.
+
+All B Hamiltonians are built as stacked (B, d, d) arrays, one stack per Mz
+block, and each stack is diagonalized with a single broadcasted
+np.linalg.eigh call. This removes the per-call Python overhead of calling
+nmrmath.nspinspec in a loop, which dominates for small spin systems.
+
+Results are returned packed, CSR-style: the peaks of system b are
+frequencies[offsets[b]:offsets[b + 1]] (and likewise for intensities).
+
+Every system gets the full spin-1/2 treatment (no cluster or
+magnetic-equivalence reduction), so results match nmrmath.simsignals.
+"""
+
+import numpy as np
+
+from secondorder.model.nmrmath import spin_basis
+
+
+def batch_hamiltonian_blocks(freqs, couplings):
+    """
+    Builds the Mz blocks of B spin Hamiltonians at once.
+
+    :param freqs: a (B, n) array of frequencies in Hz
+    :param couplings: a (B, n, n) array of couplings in Hz
+    :returns: a list of n + 1 arrays; array k has shape (B, d_k, d_k) and
+    holds the Hamiltonians of Mz block k (see nmrmath.mz_blocks)
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    J = 0.5 * (J + J.transpose(0, 2, 1))
+    nspins = freqs.shape[1]
+    J = J * (1 - np.eye(nspins))  # diagonal J only shifts all energies
+    basis = spin_basis(nspins)
+
+    H_blocks = []
+    for k, indices in enumerate(basis.blocks):
+        mz = basis.mz[indices]
+        H = np.zeros((len(freqs), len(indices), len(indices)))
+        diagonal = (freqs @ mz.T
+                    + 0.5 * np.einsum('ai,bij,aj->ba', mz, J, mz))
+        H[:, np.arange(len(indices)), np.arange(len(indices))] = diagonal
+        for (i, j), (rows, cols) in basis.flipflops.items():
+            in_block = basis.weight[rows] == k
+            H[:, basis.position[rows[in_block]],
+              basis.position[cols[in_block]]] = 0.5 * J[:, i, j, np.newaxis]
+        H_blocks.append(H)
+    return H_blocks
+
+
+def batch_signals(freqs, couplings, cutoff=0.01):
+    """
+    Calculates the spectra of B spin systems of n spin-1/2 nuclei.
+
+    :param freqs: a (B, n) array of frequencies in Hz
+    :param couplings: a (B, n, n) array of couplings in Hz
+    :param cutoff: transitions with intensity <= cutoff are discarded
+    :returns: a (frequencies, intensities, offsets) tuple of 1D arrays. The
+    peaks of system b are frequencies[offsets[b]:offsets[b + 1]] and
+    intensities[offsets[b]:offsets[b + 1]].
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    nspins = freqs.shape[1]
+    basis = spin_basis(nspins)
+    lower, upper = basis.transitions
+
+    eigensystems = [np.linalg.eigh(H)
+                    for H in batch_hamiltonian_blocks(freqs, couplings)]
+
+    frequencies, intensities = [], []
+    for k in range(nspins):
+        (E_a, V_a), (E_b, V_b) = eigensystems[k], eigensystems[k + 1]
+        in_block = basis.weight[lower] == k
+        F = np.zeros((V_a.shape[1], V_b.shape[1]))  # 2Fx between blocks
+        F[basis.position[lower[in_block]],
+          basis.position[upper[in_block]]] = 1
+        I = np.square(V_a.transpose(0, 2, 1) @ (F @ V_b))
+        v = np.abs(E_b[:, np.newaxis, :] - E_a[:, :, np.newaxis])
+        frequencies.append(v.reshape(len(freqs), -1))
+        intensities.append(I.reshape(len(freqs), -1))
+    if not frequencies:
+        empty = np.array([])
+        return empty, empty, np.zeros(len(freqs) + 1, dtype=int)
+
+    frequencies = np.concatenate(frequencies, axis=1)
+    intensities = np.concatenate(intensities, axis=1)
+    allowed = intensities > cutoff
+    offsets = np.concatenate(([0], np.cumsum(allowed.sum(axis=1))))
+    return frequencies[allowed], intensities[allowed], offsets
+
+
+def unpack(frequencies, intensities, offsets):
+    """
+    Converts packed batch_signals results to one peak list per system.
+
+    :returns: a list of B lists of (frequency, intensity) tuples, like
+    nmrmath.nspinspec
+    """
+    return [list(zip(frequencies[start:stop].tolist(),
+                     intensities[start:stop].tolist()))
+            for start, stop in zip(offsets[:-1], offsets[1:])]
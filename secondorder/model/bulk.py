@@ -0,0 +1,254 @@
+"""
+Memory-mapped storage for the results of large simulation campaigns.
+
+A bulk store is a directory of .npy arrays that are filled in place through
+memory maps (np.lib.format.open_memmap), so neither the writer nor the
+readers need to hold the results in memory:
+
+* spectra.npy    (rows, points) lineshape y values, one row per system
+* limits.npy     (rows, 2) first and last x of each row's evenly spaced grid
+* peak_rows.npy  (rows, 2) start and stop of each system's peaks
+* peaks.npy      (peaks, 2) (frequency, intensity) of all systems' peaks
+* index.json     the system IDs in row order, and the number of rows and
+                 peaks written
+
+The arrays are preallocated and doubled in size when full. Only rows and
+peaks counted in index.json are valid; the index is replaced atomically on
+flush() (and every flush_every rows, if set), so a reader (or a writer
+reopening the store after a crash) sees the results up to the last flush.
+
+Contains:
+
+* BulkWriter  Appends peak lists and lineshapes to a bulk store.
+* BulkReader  Opens a bulk store for zero-copy reading.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from secondorder.model.nmrplot import grid_step
+
+SPECTRA = 'spectra.npy'
+LIMITS = 'limits.npy'
+PEAK_ROWS = 'peak_rows.npy'
+PEAKS = 'peaks.npy'
+INDEX = 'index.json'
+
+
+def read_index(directory):
+    """Returns the index dict of the bulk store in directory."""
+    with open(os.path.join(directory, INDEX)) as f:
+        return json.load(f)
+
+
+def _grow(path, array, rows):
+    """Replaces the .npy file at path (memory-mapped as array) with one of
+    rows rows holding the same data, and returns its memory map."""
+    temp_path = path + '.tmp'
+    grown = open_memmap(temp_path, mode='w+', dtype=array.dtype,
+                        shape=(rows,) + array.shape[1:])
+    grown[:len(array)] = array
+    grown.flush()
+    del grown
+    os.replace(temp_path, path)
+    return open_memmap(path, mode='r+')
+
+
+class BulkWriter:
+    """Appends simulation results to a bulk store, creating it if needed.
+
+    Example:
+        with BulkWriter('campaign', points=2400) as writer:
+            for system_id, (v, j) in systems:
+                peaklist = nspinspec(v, j)
+                x, y = tkplot(list(peaklist), 0.5, points=2400)
+                writer.append(system_id, peaklist, x, y)
+    """
+    def __init__(self, directory, points=2400, capacity=1024,
+                 peak_capacity=None, flush_every=None):
+        """
+        Arguments:
+            directory: path of the store; an existing store is appended to
+            points: number of lineshape points per system
+            capacity: number of rows to preallocate for a new store
+            peak_capacity: number of peaks to preallocate for a new store
+            (default: 64 per row)
+            flush_every: flush after every flush_every appended rows, or
+            None to flush only on flush() and close(). The index lists all
+            IDs, so each flush costs time proportional to the store's size.
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path(INDEX)):
+            index = read_index(self.directory)
+            if index['points'] != points:
+                raise ValueError('store has {} points per spectrum, not {}'
+                                 .format(index['points'], points))
+            self.ids = index['ids']
+            self.peak_count = index['peak_count']
+            self.spectra = open_memmap(self.path(SPECTRA), mode='r+')
+            self.limits = open_memmap(self.path(LIMITS), mode='r+')
+            self.peak_rows = open_memmap(self.path(PEAK_ROWS), mode='r+')
+            self.peaks = open_memmap(self.path(PEAKS), mode='r+')
+        else:
+            capacity = max(1, capacity)
+            self.ids = []
+            self.peak_count = 0
+            self.spectra = open_memmap(self.path(SPECTRA), mode='w+',
+                                       dtype=np.float64,
+                                       shape=(capacity, points))
+            self.limits = open_memmap(self.path(LIMITS), mode='w+',
+                                      dtype=np.float64, shape=(capacity, 2))
+            self.peak_rows = open_memmap(self.path(PEAK_ROWS), mode='w+',
+                                         dtype=np.int64, shape=(capacity, 2))
+            self.peaks = open_memmap(
+                self.path(PEAKS), mode='w+', dtype=np.float64,
+                shape=(max(1, peak_capacity or 64 * capacity), 2))
+        self.points = points
+        self.flush_every = flush_every
+        self.unflushed = 0
+        self.rows = {system_id: row for row, system_id in enumerate(self.ids)}
+        self.flush()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def append(self, system_id, peaklist, x, y):
+        """
+        Appends one system's results.
+
+        :param system_id: a unique str or int identifying the system
+        :param peaklist: a list of (frequency, intensity) tuples, or an
+        (n, 2) array
+        :param x: the evenly spaced x coordinates of the lineshape
+        (e.g. from tkplot with points=self.points)
+        :param y: the lineshape's y coordinates
+        :returns: the row of the system
+        """
+        if not isinstance(system_id, (str, int)):
+            raise TypeError('system IDs must be str or int')
+        if system_id in self.rows:
+            raise ValueError('duplicate system ID: {!r}'.format(system_id))
+        y = np.asarray(y, dtype=np.float64)
+        if y.shape != (self.points,) or len(x) != self.points:
+            raise ValueError('expected {} lineshape points'
+                             .format(self.points))
+        grid_step(x)  # rows store only the limits of an even grid
+        peaks = np.asarray(peaklist, dtype=np.float64).reshape(-1, 2)
+
+        row = len(self.ids)
+        if row == len(self.spectra):
+            self.spectra = _grow(self.path(SPECTRA), self.spectra, 2 * row)
+            self.limits = _grow(self.path(LIMITS), self.limits, 2 * row)
+            self.peak_rows = _grow(self.path(PEAK_ROWS), self.peak_rows,
+                                   2 * row)
+        stop = self.peak_count + len(peaks)
+        if stop > len(self.peaks):
+            self.peaks = _grow(self.path(PEAKS), self.peaks,
+                               max(stop, 2 * len(self.peaks)))
+
+        self.spectra[row] = y
+        self.limits[row] = x[0], x[-1]
+        self.peak_rows[row] = self.peak_count, stop
+        self.peaks[self.peak_count:stop] = peaks
+        self.peak_count = stop
+        self.ids.append(system_id)
+        self.rows[system_id] = row
+        self.unflushed += 1
+        if self.flush_every and self.unflushed >= self.flush_every:
+            self.flush()
+        return row
+
+    def flush(self):
+        """Writes the arrays to disk, then atomically replaces the index,
+        making the appended rows visible to readers."""
+        for array in (self.spectra, self.limits, self.peak_rows,
+                      self.peaks):
+            array.flush()
+        index = {'points': self.points,
+                 'count': len(self.ids),
+                 'peak_count': self.peak_count,
+                 'ids': self.ids}
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_path, self.path(INDEX))
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class BulkReader:
+    """Read-only, memory-mapped view of a bulk store. Arrays returned by its
+    methods are slices of the memory maps, so nothing is read from disk
+    until it is used.
+
+    Example:
+        results = BulkReader('campaign')
+        x, y = results.spectrum('ethyl acetate')
+        mean_spectrum = results.spectra.mean(axis=0)
+    """
+    def __init__(self, directory):
+        """
+        Argument:
+            directory: path of a store written by BulkWriter
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        index = read_index(self.directory)
+        self.points = index['points']
+        self.ids = index['ids']
+        self.rows = {system_id: row for row, system_id in enumerate(self.ids)}
+        count = index['count']
+
+        def load(name):
+            return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+        self.spectra = load(SPECTRA)[:count]
+        self.limits = load(LIMITS)[:count]
+        self.peak_rows = load(PEAK_ROWS)[:count]
+        self.peaks = load(PEAKS)[:index['peak_count']]
+
+    def row(self, system_id):
+        """Returns the row of system_id (KeyError if not stored)."""
+        return self.rows[system_id]
+
+    def spectrum(self, system_id):
+        """Returns the (x, y) lineshape of system_id; y is a view of the
+        memory map."""
+        row = self.rows[system_id]
+        x = np.linspace(*self.limits[row], self.points)
+        return x, self.spectra[row]
+
+    def peaklist(self, system_id):
+        """Returns the (n, 2) array of (frequency, intensity) peaks of
+        system_id, as a view of the memory map."""
+        start, stop = self.peak_rows[self.rows[system_id]]
+        return self.peaks[start:stop]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, system_id):
+        return system_id in self.rows
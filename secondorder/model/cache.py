@@ -0,0 +1,106 @@
+"""
+In-memory caching of simulation results.
+
+Contains:
+
+* spectrum_key  Canonical hash of a spin system's (v, J, w) variables.
+* LRUCache      A size-limited least-recently-used cache with hit, miss and
+                eviction statistics.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def spectrum_key(v, j, w=None, simulation='QM'):
+    """
+    Computes a canonical hash of a simulation request.
+    Frequencies and couplings are converted to float64 (so that lists,
+    integer arrays and np.matrix objects with the same values give the same
+    key), and the coupling matrix is symmetrized, as the model does.
+
+    :param v: a 1-D array of frequencies
+    :param j: a 2-D array of coupling constants
+    :param w: line width at half height, or None for a key that does not
+    depend on line width (e.g. for peak lists)
+    :param simulation: the simulation type (see Controller.update_with_dict)
+    :returns: a hex digest string
+    """
+    v = np.ascontiguousarray(v, dtype=np.float64).ravel()
+    j = np.asarray(j, dtype=np.float64)
+    j = np.ascontiguousarray(0.5 * (j + j.T))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(simulation.encode())
+    digest.update(np.array(v.shape + j.shape, dtype=np.int64).tobytes())
+    digest.update((v + 0.0).tobytes())  # + 0.0 turns -0.0 into 0.0
+    digest.update((j + 0.0).tobytes())
+    if w is not None:
+        digest.update(np.float64(w).tobytes())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache with a size limit.
+
+    Statistics on hits, misses and evictions are kept for tuning the size
+    limit (see stats()).
+    """
+    def __init__(self, maxsize=128):
+        """
+        Argument:
+            maxsize: maximum number of entries kept
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Returns the value stored for key (marking it as recently used), or
+        default if key is not cached."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting the least recently used entries if
+        the cache is full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Empties the cache. Statistics are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Returns a dict of hits, misses, evictions, size and maxsize."""
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._data),
+                    'maxsize': self.maxsize}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,244 @@
+"""
+First-order (weak coupling) and hybrid simulations of spin-1/2 systems.
+
+When |J| << |delta-v| for a pair of nuclei, their coupling only splits each
+line symmetrically (the X approximation), and a full quantum-mechanical
+diagonalization is not needed. These functions return spectra on the same
+intensity scale as nmrmath.nspinsignals, so the results can be plotted and
+compared interchangeably.
+
+Contains:
+
+* first_order_signals       Splitting-tree (multiplet) spectrum.
+* strong_coupling_groups    Groups of nuclei connected by strong couplings.
+* hybrid_signals            Exact treatment of strongly coupled groups, with
+                            the weak couplings between groups treated to
+                            first order.
+* auto_signals              Picks the cheapest adequate method.
+* firstorderspec, autospec  (frequency, intensity) list versions, like
+                            nmrmath.nspinspec.
+* SIMULATIONS               The peak list function for each simulation type
+                            ('QM', 'FO' or 'auto').
+
+Errors in line positions from treating a coupling J between nuclei
+separated by delta-v to first order are of the order J**2 / delta-v.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from secondorder.model.nmrmath import (block_signals, hamiltonian_bitwise,
+                                       mz_eigensystems, mz_table,
+                                       nspinsignals, nspinspec)
+
+
+def merge_lines(frequencies, intensities, decimals=6):
+    """
+    Combines coincident lines by adding their intensities.
+
+    :param frequencies: 1D array of line frequencies
+    :param intensities: 1D array of line intensities
+    :param decimals: frequencies that agree when rounded to this many
+    decimal places are treated as the same line
+    :returns: (frequencies, intensities) tuple of 1D arrays, sorted by
+    frequency
+    """
+    unique, inverse = np.unique(np.round(frequencies, decimals),
+                                return_inverse=True)
+    return unique, np.bincount(inverse.ravel(), weights=intensities)
+
+
+def first_order_signals(freqs, couplings, tol=1e-6):
+    """
+    Calculates a first-order spectrum by building a splitting tree for each
+    nucleus: every non-zero coupling splits each line into two lines of half
+    intensity, J/2 either side of it. Couplings between nuclei with the same
+    frequency (within tol) are not observed, so they do not split.
+
+    :param freqs: a list of n nuclei frequencies in Hz
+    :param couplings: an n x n array of couplings in Hz
+    :param tol: tolerance in Hz for two frequencies to be the same (as in
+    nmrmath.equivalent_groups)
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    J = 0.5 * (J + J.T)
+    nspins = len(freqs)
+    frequencies, intensities = [], []
+    for i in range(nspins):
+        v = freqs[i:i + 1]
+        I = np.array([2.0 ** (nspins - 1)])  # same scale as nspinsignals
+        for j in np.flatnonzero(J[i]):
+            if abs(freqs[j] - freqs[i]) <= tol:  # includes j == i
+                continue
+            v = np.concatenate((v - 0.5 * J[i, j], v + 0.5 * J[i, j]))
+            I = np.concatenate((I, I)) / 2
+            v, I = merge_lines(v, I)
+        frequencies.append(np.abs(v))
+        intensities.append(I)
+    if not frequencies:
+        return np.array([]), np.array([])
+    return np.concatenate(frequencies), np.concatenate(intensities)
+
+
+def strong_coupling_groups(freqs, couplings, threshold=0.1):
+    """
+    Groups nuclei that are connected by strong couplings, i.e. non-zero
+    couplings with |J / delta-v| >= threshold.
+
+    :param freqs: a list of n nuclei frequencies in Hz
+    :param couplings: an n x n array of couplings in Hz
+    :param threshold: the |J / delta-v| ratio above which a coupling is
+    treated exactly
+    :returns: a list of integer index arrays, one per group. Nuclei with no
+    strong couplings form groups of one.
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.abs(np.asarray(couplings, dtype=float))
+    J = np.maximum(J, J.T)
+    dv = np.abs(freqs[:, np.newaxis] - freqs[np.newaxis, :])
+    strong = (J != 0) & (J >= threshold * dv)
+    np.fill_diagonal(strong, False)
+    ngroups, labels = connected_components(csr_matrix(strong),
+                                           directed=False)
+    return [np.flatnonzero(labels == g) for g in range(ngroups)]
+
+
+def group_state_expectations(freqs, couplings):
+    """
+    Solves one group of nuclei exactly, and returns the <Iz> expectation
+    value of each nucleus in each of its 2**k eigenstates.
+
+    :param freqs: a list of k nuclei frequencies in Hz
+    :param couplings: a k x k array of couplings in Hz
+    :returns: a 2**k x k array
+    """
+    k = len(freqs)
+    blocks = mz_eigensystems(hamiltonian_bitwise(freqs, couplings,
+                                                 sparse=True), k)
+    mz = mz_table(k)
+    return np.concatenate([np.square(V).T @ mz[indices]
+                           for indices, _, V in blocks])
+
+
+def hybrid_signals(freqs, couplings, threshold=0.1, cutoff=0.01):
+    """
+    Calculates a spectrum by solving each strongly coupled group of nuclei
+    (see strong_coupling_groups) exactly, and treating the weak couplings
+    between groups to first order (the X approximation).
+    Each eigenstate of the other groups shifts the frequency of nucleus i in
+    the group by sum(J_ik * <Iz_k>); the group is solved once for every
+    distinct set of these effective frequencies, as in the ab-subspectra
+    analysis of an ABX system.
+
+    :param freqs: a list of n nuclei frequencies in Hz
+    :param couplings: an n x n array of couplings in Hz
+    :param threshold: the |J / delta-v| ratio above which a coupling is
+    treated exactly
+    :param cutoff: minimum intensity (per degenerate copy) for a transition
+    of a group to be reported
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    J = 0.5 * (J + J.T)
+    nspins = len(freqs)
+    groups = strong_coupling_groups(freqs, J, threshold)
+    states = [group_state_expectations(freqs[g], J[np.ix_(g, g)])
+              for g in groups]
+
+    frequencies, intensities = [], []
+    for a, group in enumerate(groups):
+        # Distinct frequency shifts of the group's nuclei, and the fraction
+        # of the other groups' states that produce each of them
+        shifts = np.zeros((1, len(group)))
+        weights = np.ones(1)
+        for b, other in enumerate(groups):
+            J_ab = J[np.ix_(group, other)]
+            if b == a or not J_ab.any():
+                continue
+            nstates = len(states[b])
+            shifts = (shifts[:, np.newaxis, :]
+                      + (states[b] @ J_ab.T)[np.newaxis, :, :]
+                      ).reshape(-1, len(group))
+            weights = np.repeat(weights / nstates, nstates)
+            shifts, inverse = np.unique(np.round(shifts, 9), axis=0,
+                                        return_inverse=True)
+            weights = np.bincount(inverse.ravel(), weights=weights)
+        weights = weights * 2 ** (nspins - len(group))
+
+        k = len(group)
+        if k == 1:
+            frequencies.append(np.abs(freqs[group[0]] + shifts[:, 0]))
+            intensities.append(weights)
+            continue
+        J_group = J[np.ix_(group, group)]
+        for shift, weight in zip(shifts, weights):
+            H = hamiltonian_bitwise(freqs[group] + shift, J_group,
+                                    sparse=True)
+            v, I = block_signals(mz_eigensystems(H, k), k, cutoff)
+            frequencies.append(v)
+            intensities.append(I * weight)
+    if not frequencies:
+        return np.array([]), np.array([])
+    return merge_lines(np.concatenate(frequencies),
+                       np.concatenate(intensities))
+
+
+def auto_signals(freqs, couplings, threshold=0.1, cutoff=0.01):
+    """
+    Calculates a spectrum with the cheapest method that treats every
+    coupling with |J / delta-v| >= threshold exactly:
+
+    * no strong couplings: first_order_signals
+    * every coupled cluster is one strongly coupled group:
+      nmrmath.nspinsignals
+    * otherwise: hybrid_signals
+
+    :param freqs: a list of n nuclei frequencies in Hz
+    :param couplings: an n x n array of couplings in Hz
+    :param threshold: the |J / delta-v| ratio above which a coupling is
+    treated exactly
+    :param cutoff: minimum intensity for a transition to be reported
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    J = np.asarray(couplings, dtype=float)
+    groups = strong_coupling_groups(freqs, J, threshold)
+    if all(len(group) == 1 for group in groups):
+        return first_order_signals(freqs, J)
+    weak = J.copy()
+    for group in groups:
+        weak[np.ix_(group, group)] = 0
+    if not weak.any():
+        return nspinsignals(freqs, J, cutoff)
+    return hybrid_signals(freqs, J, threshold, cutoff)
+
+
+def firstorderspec(freqs, couplings):
+    """
+    List version of first_order_signals.
+
+    :returns: a list of (frequency, intensity) tuples
+    """
+    frequencies, intensities = first_order_signals(freqs, couplings)
+    return list(zip(frequencies.tolist(), intensities.tolist()))
+
+
+def autospec(freqs, couplings, threshold=0.1, cutoff=0.01):
+    """
+    List version of auto_signals.
+
+    :returns: a list of (frequency, intensity) tuples
+    """
+    frequencies, intensities = auto_signals(freqs, couplings, threshold,
+                                            cutoff)
+    return list(zip(frequencies.tolist(), intensities.tolist()))
+
+
+# Peak list functions for each simulation type: 'QM' (full quantum-mechanical
+# calculation), 'FO' (first order) and 'auto' (see auto_signals)
+SIMULATIONS = {'QM': nspinspec,
+               'FO': firstorderspec,
+               'auto': autospec}
@@ -5,11 +5,22 @@ Hamilton code is about 10x faster. The overall performance is dramatically
 better than the original code.
 """
 
+import os
 import numpy as np
 
-from math import sqrt
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
+from math import comb, sqrt
 from scipy.linalg import eigh
-from scipy.sparse import kron, csc_matrix, csr_matrix, lil_matrix, bmat
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse import kron, csr_matrix, coo_matrix, bmat, issparse
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
 
 
 def popcount(n=0):
@@ -37,6 +48,84 @@ def is_allowed(m=0, n=0):
     return popcount(m ^ n) == 1
 
 
+# Parameter-independent structures for each spin count. Only the most
+# recently used spin counts are kept (a 14-spin basis takes ~15 MB).
+SpinBasis = namedtuple('SpinBasis', ['nspins', 'mz', 'blocks', 'position',
+                                     'weight', 'transitions', 'flipflops'])
+
+
+@lru_cache(maxsize=16)
+def spin_basis(nspins):
+    """
+    Precomputes everything about the 2**nspins product basis that does not
+    depend on frequencies or couplings. Results are cached per spin count
+    (bounded; see spin_basis.cache_info()), and all arrays are read-only.
+
+    input:
+        :param nspins: number of nuclei
+
+    :returns: a SpinBasis namedtuple with fields:
+        nspins: number of nuclei
+        mz: 2**nspins x nspins table of +/-0.5 mz values (see mz_table)
+        blocks: tuple of index arrays of the states in each Mz block (see
+        mz_blocks)
+        position: index of each state within its Mz block
+        weight: Mz block (number of beta spins) of each state
+        transitions: (lower, upper) single-spin-flip pairs (see
+        transition_pairs)
+        flipflops: dict mapping each pair (i, j), i < j, to the (rows,
+        cols) indices of its flip-flop matrix elements
+    """
+    states = np.arange(2 ** nspins)
+    shifts = nspins - 1 - np.arange(nspins)
+    bits = (states[:, np.newaxis] >> shifts) & 1
+    mz = 0.5 - bits
+    weight = bits.sum(axis=1)
+    blocks = tuple(np.flatnonzero(weight == k) for k in range(nspins + 1))
+    position = np.empty(2 ** nspins, dtype=int)
+    for indices in blocks:
+        position[indices] = np.arange(len(indices))
+
+    lower, upper = [np.array([], dtype=int)], [np.array([], dtype=int)]
+    for k in range(nspins):
+        unflipped = states[(states >> k) & 1 == 0]
+        lower.append(unflipped)
+        upper.append(unflipped ^ (1 << k))
+    transitions = (np.concatenate(lower), np.concatenate(upper))
+
+    # J/2 (I+I- + I-I+) connects states that differ by swapping one alpha
+    # and one beta spin of the coupled pair.
+    flipflops = {}
+    for i in range(nspins - 1):
+        for j in range(i + 1, nspins):
+            rows = states[bits[:, i] != bits[:, j]]
+            cols = rows ^ ((1 << shifts[i]) | (1 << shifts[j]))
+            flipflops[i, j] = (rows, cols)
+
+    arrays = [mz, weight, position, *blocks, *transitions,
+              *[a for pair in flipflops.values() for a in pair]]
+    for array in arrays:
+        array.setflags(write=False)
+    return SpinBasis(nspins, mz, blocks, position, weight, transitions,
+                     flipflops)
+
+
+def transition_pairs(nspins):
+    """
+    Generates the index pairs of all allowed (single-spin-flip) transitions
+    between the 2**nspins product-basis states. Results are memoized per
+    spin count (see spin_basis).
+
+    input:
+        :param nspins: number of nuclei
+
+    :returns: a (lower, upper) tuple of read-only integer arrays of length
+    nspins * 2**(nspins - 1), where upper = lower ^ (1 << k) for the flipped
+    bit k, and lower has that bit clear (so lower < upper).
+    """
+    return spin_basis(nspins).transitions
+
+
 def transition_matrix(n):
     """
     Creates a matrix of allowed transitions.
@@ -51,15 +140,141 @@ def transition_matrix(n):
     :returns: a transition matrix that can be used to compute the intensity of
     allowed transitions.
     """
-    # function was optimized by only calculating upper triangle and then adding
-    # the lower.
-    T = lil_matrix((n, n))  # sparse matrix created
-    for i in range(n - 1):
-        for j in range(i + 1, n):
-            if is_allowed(i, j):
-                T[i, j] = 1
-    T = T + T.T
-    return T
+    # Built from the memoized single-bit-flip pairs instead of testing every
+    # (i, j) pair with is_allowed.
+    lower, upper = transition_pairs(max(n - 1, 0).bit_length())
+    inside = upper < n
+    lower, upper = lower[inside], upper[inside]
+    rows = np.concatenate((lower, upper))
+    cols = np.concatenate((upper, lower))
+    T = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    return T.tocsr()
+
+
+def mz_table(nspins):
+    """
+    Tabulates the mz quantum number of every nucleus in every product-basis
+    state. Spin 0 is the most significant bit of the state index; a 0 bit
+    is alpha (mz = +1/2) and a 1 bit is beta (mz = -1/2).
+
+    input:
+        :param nspins: number of nuclei
+    :returns: a read-only 2**nspins x nspins array of +/-0.5 values
+    """
+    return spin_basis(nspins).mz
+
+
+def mz_blocks(nspins):
+    """
+    Groups the 2**nspins product-basis states by total Mz.
+    The scalar-coupled spin-1/2 Hamiltonian never connects states with a
+    different number of beta spins, so each group is an independent block.
+
+    input:
+        :param nspins: number of nuclei
+
+    :returns: a list of nspins + 1 integer arrays. Array k holds the sorted
+    basis indices of the states with k beta spins (popcount k).
+    """
+    return list(spin_basis(nspins).blocks)
+
+
+def parallel_eigh(matrices, threads=None):
+    """
+    Diagonalizes independent symmetric matrices (e.g. Mz blocks or spin
+    clusters) on a pool of threads. LAPACK releases the GIL, so the solves
+    run at the same time without the overhead of worker processes.
+
+    The work of a solve grows as d**3 for a d x d matrix. Matrices with at
+    least 1/threads of the total work are solved first, one at a time, with
+    all BLAS threads. The rest are solved largest first on the thread pool
+    (so that the longest solves do not start last), with BLAS limited to
+    cpu_count // threads threads meanwhile to avoid oversubscribing the
+    cores. Limiting BLAS needs the optional threadpoolctl package; without
+    it, all the matrices are solved one at a time.
+
+    :param matrices: a list of symmetric 2D arrays
+    :param threads: number of threads (default: all CPUs)
+    :returns: a list of (E, V) tuples in the order of matrices, as from
+    np.linalg.eigh
+    """
+    threads = threads or os.cpu_count() or 1
+    results = [None] * len(matrices)
+    costs = [float(len(matrix)) ** 3 for matrix in matrices]
+    order = sorted(range(len(matrices)), key=lambda i: -costs[i])
+    if threads == 1 or threadpool_limits is None:
+        large, small = order, []
+    else:
+        share = sum(costs) / threads
+        large = [i for i in order if costs[i] >= share]
+        small = [i for i in order if costs[i] < share]
+
+    for i in large:
+        results[i] = np.linalg.eigh(matrices[i])
+    if small:
+        limits = threadpool_limits(max(1, (os.cpu_count() or 1) // threads))
+        with limits, ThreadPoolExecutor(min(threads, len(small))) as pool:
+            solutions = pool.map(np.linalg.eigh,
+                                 [matrices[i] for i in small])
+            for i, solution in zip(small, solutions):
+                results[i] = solution
+    return results
+
+
+def mz_eigensystems(H, nspins, threads=1):
+    """
+    Diagonalizes the Hamiltonian one Mz block at a time.
+    The largest block is C(n, n/2) states instead of 2**n.
+
+    inputs:
+        :param H: a 2**nspins x 2**nspins Hamiltonian (array or sparse matrix)
+        :param nspins: number of nuclei
+        :param threads: number of threads diagonalizing blocks at the same
+        time (see parallel_eigh); None for all CPUs
+    :returns: a list of (indices, E, V) tuples, one per Mz block, where
+    indices are the block's basis states, E the block eigenvalues, and V the
+    block eigenvectors (columns) in the basis given by indices.
+    """
+    if issparse(H):
+        H = H.tocsr()
+    else:
+        H = np.asarray(H).real
+    H_blocks = []
+    for indices in mz_blocks(nspins):
+        if issparse(H):
+            H_blocks.append(H[indices][:, indices].toarray())
+        else:
+            H_blocks.append(H[np.ix_(indices, indices)])
+    if threads == 1:
+        solutions = [np.linalg.eigh(H_block) for H_block in H_blocks]
+    else:
+        solutions = parallel_eigh(H_blocks, threads)
+    return [(indices, E, V)
+            for indices, (E, V) in zip(mz_blocks(nspins), solutions)]
+
+
+def blockdiag_eigh(H, nspins):
+    """
+    Solves the spin Hamiltonian H by Mz block, and rebuilds the full
+    eigensystem. Returns the same (E, V) as np.linalg.eigh(H), with
+    eigenvalues in ascending order, but eigenvectors never mix states
+    from different Mz blocks.
+
+    inputs:
+        :param H: a 2**nspins x 2**nspins Hamiltonian array
+        :param nspins: number of nuclei
+    :returns: (E, V) tuple of eigenvalues and eigenvectors (columns)
+    """
+    m = 2 ** nspins
+    E = np.empty(m)
+    V = np.zeros((m, m))
+    for indices, E_block, V_block in mz_eigensystems(H, nspins):
+        # Each block's eigenvectors are stored in the columns that share
+        # the block's basis indices, then everything is put in energy order.
+        E[indices] = E_block
+        V[np.ix_(indices, indices)] = V_block
+    order = np.argsort(E, kind='stable')
+    return E[order], V[:, order]
 
 
 def hamiltonian(freqlist, couplings):
@@ -69,104 +284,361 @@ def hamiltonian(freqlist, couplings):
         :param freqlist: a list of frequencies in Hz of length n
         :param couplings: an n x n array of coupling constants in Hz
     Returns: a Hamiltonian array
+
+    Kept for compatibility: the matrix is built by hamiltonian_bitwise,
+    which does not form (or cache) Kronecker products of spin operators.
+    """
+    return hamiltonian_bitwise(freqlist, couplings)
+
+
+def hamiltonian_bitwise(freqlist, couplings, sparse=False):
     """
-    nspins = len(freqlist)
-
-    # Define Pauli matrices
-    sigma_x = np.matrix([[0, 1 / 2], [1 / 2, 0]])
-    sigma_y = np.matrix([[0, -1j / 2], [1j / 2, 0]])
-    sigma_z = np.matrix([[1 / 2, 0], [0, -1 / 2]])
-    unit = np.matrix([[1, 0], [0, 1]])
-
-    # The following empty arrays will be used to store the
-    # Cartesian spin operators.
-    Lx = np.empty((1, nspins), dtype='object')
-    Ly = np.empty((1, nspins), dtype='object')
-    Lz = np.empty((1, nspins), dtype='object')
-
-    for n in range(nspins):
-        Lx[0, n] = 1
-        Ly[0, n] = 1
-        Lz[0, n] = 1
-        for k in range(nspins):
-            if k == n:                                  # Diagonal element
-                Lx[0, n] = np.kron(Lx[0, n], sigma_x)
-                Ly[0, n] = np.kron(Ly[0, n], sigma_y)
-                Lz[0, n] = np.kron(Lz[0, n], sigma_z)
-            else:                                       # Off-diagonal element
-                Lx[0, n] = np.kron(Lx[0, n], unit)
-                Ly[0, n] = np.kron(Ly[0, n], unit)
-                Lz[0, n] = np.kron(Lz[0, n], unit)
-
-    Lcol = np.vstack((Lx, Ly, Lz)).real
-    Lrow = Lcol.T  # As opposed to sparse version of code, this works!
-    Lproduct = np.dot(Lrow, Lcol)
-
-    # Hamiltonian operator
-    H = np.zeros((2**nspins, 2**nspins))
-
-    # Add Zeeman interactions:
-    for n in range(nspins):
-        H = H + freqlist[n] * Lz[0, n]
-
-    # Scalar couplings
-
-    # Testing with MATLAB discovered J must be /2.
-    # Believe it is related to the fact that in the SpinDynamics.org simulation
-    # freqs are *2pi, but Js by pi only.
-    scalars = 0.5 * couplings
-    scalars = np.multiply(scalars, Lproduct)
-    for n in range(nspins):
-        for k in range(nspins):
-            H += scalars[n, k].real
+    Computes the spin Hamiltonian by writing the matrix elements directly
+    from the bit patterns of the basis indices, instead of forming Kronecker
+    products of spin operators.
+    Spin 0 is the most significant bit; a 0 bit is alpha (mz = +1/2) and a
+    1 bit is beta (mz = -1/2).
 
+    inputs for n nuclei:
+        :param freqlist: a list of frequencies in Hz of length n
+        :param couplings: an n x n array of coupling constants in Hz
+        :param sparse: if True, return a scipy.sparse csr_matrix instead of a
+        dense array
+    Returns: a real Hamiltonian array (or csr_matrix)
+    """
+    freqs = np.asarray(freqlist, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    nspins = len(freqs)
+    m = 2 ** nspins
+    basis = spin_basis(nspins)
+    states = np.arange(m)
+    mz = basis.mz
+
+    # Each J[n, k] and J[k, n] contributes J/2 * In.Ik.
+    Jsym = 0.5 * (J + J.T)
+    Joff = Jsym - np.diag(np.diag(Jsym))
+
+    # Diagonal: Zeeman terms, Jz terms, and the constant In.In = 3/4 term
+    # from any diagonal J elements.
+    diagonal = (mz @ freqs
+                + 0.5 * np.sum((mz @ Joff) * mz, axis=1)
+                + 0.375 * np.trace(J))
+
+    # Off-diagonal flip-flop terms J/2 (I+I- + I-I+), at the precomputed
+    # positions for each coupled pair
+    rows, cols, data = [states], [states], [diagonal]
+    for (i, j), (flip_rows, flip_cols) in basis.flipflops.items():
+        if Joff[i, j] == 0:
+            continue
+        rows.append(flip_rows)
+        cols.append(flip_cols)
+        data.append(np.full(len(flip_rows), 0.5 * Joff[i, j]))
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    data = np.concatenate(data)
+
+    if sparse:
+        return coo_matrix((data, (rows, cols)), shape=(m, m)).tocsr()
+    H = np.zeros((m, m))
+    H[rows, cols] = data  # no (row, col) pair is written twice
     return H
 
 
-def simsignals(H, nspins):
+def transition_intensities(blocks, nspins):
+    """
+    Computes the squared matrix elements of 2Fx (the total Fx operator, on
+    the scale used by transition_matrix) between the eigenstates of each
+    pair of adjacent Mz blocks. Only these elements can be non-zero.
+
+    inputs:
+        :param blocks: the list of (indices, E, V) tuples returned by
+        mz_eigensystems
+        :param nspins: number of nuclei
+    :returns: a list of nspins arrays; array k has shape
+    (len(blocks[k][0]), len(blocks[k + 1][0])) and holds the intensities of
+    the transitions from the eigenstates of block k to those of block k + 1.
+    """
+    basis = spin_basis(nspins)
+    lower, upper = basis.transitions
+    position, weight = basis.position, basis.weight
+
+    intensities = []
+    for k in range(nspins):
+        indices_a, _, V_a = blocks[k]
+        indices_b, _, V_b = blocks[k + 1]
+        in_block = weight[lower] == k
+        F = csr_matrix((np.ones(np.count_nonzero(in_block)),
+                        (position[lower[in_block]],
+                         position[upper[in_block]])),
+                       shape=(len(indices_a), len(indices_b)))
+        intensities.append(np.square(V_a.T @ (F @ V_b)))
+    return intensities
+
+
+def block_signals(blocks, nspins, cutoff=0.01):
+    """
+    Computes the transitions between the eigenstates of adjacent Mz blocks
+    (see transition_intensities).
+    Intensities use the same scale as transition_matrix, i.e. the squared
+    matrix elements of 2Fx (a lone spin gives one line of intensity 1).
+
+    inputs:
+        :param blocks: the list of (indices, E, V) tuples returned by
+        mz_eigensystems
+        :param nspins: number of nuclei
+        :param cutoff: transitions with intensity <= cutoff are discarded
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    frequencies, intensities = [], []
+    for k, I in enumerate(transition_intensities(blocks, nspins)):
+        E_a, E_b = blocks[k][1], blocks[k + 1][1]
+        allowed = I > cutoff
+        v = np.abs(E_b[np.newaxis, :] - E_a[:, np.newaxis])
+        frequencies.append(v[allowed])
+        intensities.append(I[allowed])
+    if not frequencies:
+        return np.array([]), np.array([])
+    return np.concatenate(frequencies), np.concatenate(intensities)
+
+
+def simsignals(H, nspins, cutoff=0.01):
     """
     Solves the spin Hamiltonian H and returns a list of (frequency, intensity)
     tuples. Nuclei must be spin-1/2.
     Inputs:
         :param H: a Hamiltonian array
         :param nspins: number of nuclei
+        :param cutoff: minimum intensity for a transition to be reported
     :return spectrum: a list of (frequency, intensity) tuples.
     """
-    # This routine was optimized for speed by vectorizing the intensity
-    # calculations, replacing a nested-for signal-by-signal calculation.
-    # Considering that hamiltonian was dramatically faster when refactored to
-    # use arrays instead of sparse matrices, consider an array refactor to this
-    # function as well.
+    # H is diagonalized one Mz block at a time, and intensities are only
+    # calculated between eigenstates of adjacent blocks (see block_signals),
+    # replacing the dense V.T * T * V product and the loop over all pairs.
+    blocks = mz_eigensystems(H, nspins)
+    frequencies, intensities = block_signals(blocks, nspins, cutoff)
+    return list(zip(frequencies.tolist(), intensities.tolist()))
 
-    # The eigensolution calculation apparently must be done on a dense matrix,
-    # because eig functions on sparse matrices can't return all answers?!
-    # Using eigh so that answers have only real components and no residual small
-    # unreal components b/c of rounding errors
-    E, V = np.linalg.eigh(H)    # V will be eigenvectors, v will be frequencies
 
-    # Eigh still leaves residual 0j terms, so:
-    V = np.asmatrix(V.real)
+def spin_clusters(couplings):
+    """
+    Splits a spin system into its independent clusters: the connected
+    components of the graph whose edges are the non-zero couplings.
 
-    # Calculate signal intensities
-    Vcol = csc_matrix(V)
-    Vrow = csr_matrix(Vcol.T)
-    m = 2 ** nspins
-    T = transition_matrix(m)
-    I = Vrow * T * Vcol
-    I = np.square(I.todense())
+    input:
+        :param couplings: an n x n array of couplings in Hz
+    :returns: a list of integer index arrays, one per cluster
+    """
+    J = np.asarray(couplings)
+    graph = csr_matrix((J != 0) | (J.T != 0))
+    ncomponents, labels = connected_components(graph, directed=False)
+    return [np.flatnonzero(labels == c) for c in range(ncomponents)]
+
+
+def equivalent_groups(freqs, couplings, tol=1e-6):
+    """
+    Finds sets of magnetically equivalent nuclei: nuclei with the same
+    frequency and the same coupling to every other nucleus (within tol).
+
+    inputs:
+        :param freqs: a list of n nuclei frequencies in Hz
+        :param couplings: an n x n array of couplings in Hz
+        :param tol: tolerance in Hz for frequencies and couplings to be
+        considered identical
+    :returns: a list of integer index arrays, one per set of equivalent
+    nuclei, in order of their first member
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    J = 0.5 * (J + J.T)
+    nspins = len(freqs)
+
+    def equivalent(i, j):
+        others = np.ones(nspins, dtype=bool)
+        others[[i, j]] = False
+        return (abs(freqs[i] - freqs[j]) <= tol
+                and np.all(np.abs(J[i, others] - J[j, others]) <= tol))
+
+    groups = []
+    for i in range(nspins):
+        for group in groups:
+            if all(equivalent(i, j) for j in group):
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return [np.array(group) for group in groups]
+
+
+def total_spin_multiplicities(m):
+    """
+    Decomposes a set of m equivalent spin-1/2 nuclei into composite
+    particles of total spin S.
 
-    spectrum = []
-    for i in range(m - 1):
-        for j in range(i + 1, m):
-            if I[i, j] > 0.01:  # consider making this minimum intensity
-                                # cutoff a function arg, for flexibility
-                v = abs(E[i] - E[j])
-                spectrum.append((v, I[i, j]))
+    input:
+        :param m: number of equivalent nuclei
+    :returns: a list of (S, multiplicity) tuples, from S = m/2 down to 0 or
+    1/2. For example, m=3 (a methyl group) gives [(1.5, 1), (0.5, 2)].
+    """
+    return [(m / 2 - k, comb(m, k) - (comb(m, k - 1) if k else 0))
+            for k in range(m // 2 + 1)]
 
-    return spectrum
 
+def composite_operators(spins):
+    """
+    Builds the Cartesian product basis of a set of composite particles, and
+    the spin operators needed for the composite Hamiltonian.
+    Within each particle the states are ordered from mz = +S down to -S
+    (for S = 1/2 this is the alpha, beta order used by hamiltonian).
 
-def nspinspec(freqs, couplings):
+    input:
+        :param spins: a list of total spin quantum numbers S, one per
+        particle
+    :returns: a (Lz, Lplus) tuple of lists of dense operator arrays, one of
+    each per particle, acting on the full product basis
+    """
+    dims = [int(round(2 * S)) + 1 for S in spins]
+    Lz, Lplus = [], []
+    for n, S in enumerate(spins):
+        mz = S - np.arange(dims[n])
+        z = np.diag(mz)
+        # <m+1|I+|m> = sqrt(S(S+1) - m(m+1)); the m+1 state is one row up
+        plus = np.diag(np.sqrt(S * (S + 1) - mz[1:] * (mz[1:] + 1)), k=1)
+        before = np.eye(int(np.prod(dims[:n])))
+        after = np.eye(int(np.prod(dims[n + 1:])))
+        Lz.append(np.kron(np.kron(before, z), after))
+        Lplus.append(np.kron(np.kron(before, plus), after))
+    return Lz, Lplus
+
+
+def composite_particle_signals(freqs, spins, couplings, cutoff=0.01):
+    """
+    Calculates the transitions for one set of composite particles.
+    Intensities use the same scale as block_signals (squared matrix
+    elements of 2Fx).
+
+    inputs:
+        :param freqs: a list of frequencies in Hz, one per particle
+        :param spins: a list of total spins S, one per particle
+        :param couplings: a square array of couplings in Hz between the
+        particles (between any one nucleus of each)
+        :param cutoff: transitions with intensity <= cutoff are discarded
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    Lz, Lplus = composite_operators(spins)
+    nparticles = len(spins)
+    H = sum(freqs[n] * Lz[n] for n in range(nparticles))
+    for i in range(nparticles - 1):
+        for j in range(i + 1, nparticles):
+            if couplings[i, j] == 0:
+                continue
+            # Ii.Ij = IzIz + (I+I- + I-I+)/2, all real
+            flipflop = Lplus[i] @ Lplus[j].T
+            H = H + couplings[i, j] * (Lz[i] @ Lz[j]
+                                       + 0.5 * (flipflop + flipflop.T))
+    T = sum(Lplus[n] + Lplus[n].T for n in range(nparticles))  # 2Fx
+
+    # Diagonalize by total Mz (twice Mz is an integer), from high Mz to low
+    twice_mz = np.rint(2 * np.diag(sum(Lz))).astype(int)
+    levels = sorted(set(twice_mz), reverse=True)
+    blocks = []
+    for level in levels:
+        indices = np.flatnonzero(twice_mz == level)
+        E, V = np.linalg.eigh(H[np.ix_(indices, indices)])
+        blocks.append((indices, E, V))
+
+    frequencies, intensities = [], []
+    for (indices_a, E_a, V_a), (indices_b, E_b, V_b) in zip(blocks,
+                                                            blocks[1:]):
+        I = np.square(V_a.T @ T[np.ix_(indices_a, indices_b)] @ V_b)
+        allowed = I > cutoff
+        v = np.abs(E_b[np.newaxis, :] - E_a[:, np.newaxis])
+        frequencies.append(v[allowed])
+        intensities.append(I[allowed])
+    if not frequencies:
+        return np.array([]), np.array([])
+    return np.concatenate(frequencies), np.concatenate(intensities)
+
+
+def composite_signals(freqs, counts, couplings, cutoff=0.01):
+    """
+    Calculates the spectrum of a spin system described by sets of
+    magnetically equivalent nuclei, e.g. counts=[3, 2, 1] for an A3B2X
+    system. Each set is replaced by composite particles of total spin S
+    (see total_spin_multiplicities), and every combination of composite
+    particles is simulated separately and weighted by its multiplicity.
+    Couplings inside a set do not affect the spectrum and are ignored.
+
+    inputs:
+        :param freqs: a list of frequencies in Hz, one per set
+        :param counts: a list of the number of nuclei in each set
+        :param couplings: a square array of couplings in Hz between the sets
+        :param cutoff: minimum intensity (per composite particle
+        combination) for a transition to be reported
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays, on the
+    same intensity scale as the full calculation on all nuclei
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    J = np.asarray(couplings, dtype=float)
+    J = 0.5 * (J + J.T)
+    frequencies, intensities = [], []
+    for combination in product(*[total_spin_multiplicities(m)
+                                 for m in counts]):
+        spins = [S for S, _ in combination]
+        weight = np.prod([multiplicity for _, multiplicity in combination])
+        v, I = composite_particle_signals(freqs, spins, J, cutoff)
+        frequencies.append(v)
+        intensities.append(I * weight)
+    return np.concatenate(frequencies), np.concatenate(intensities)
+
+
+def nspinsignals(freqs, couplings, cutoff=0.01, equivalence=True,
+                 threads=1):
+    """
+    Calculates the spectrum for n spin-half nuclei as numpy arrays.
+    Each independent cluster of coupled spins (see spin_clusters) is
+    simulated on its own. A cluster of k spins in an n-spin system has
+    2**(n - k) degenerate copies of each line, so its intensities are scaled
+    by that factor, and the total lineshape is the same as for a single
+    calculation on all n spins.
+    If a cluster contains magnetically equivalent nuclei (see
+    equivalent_groups), it is simulated with composite_signals.
+
+    Inputs:
+        :param freqs: a list of n nuclei frequencies in Hz
+        :param couplings: an n x n array of couplings in Hz
+        :param cutoff: minimum intensity (per degenerate copy) for a
+        transition to be reported
+        :param equivalence: if False, magnetically equivalent nuclei are not
+        detected, and every cluster gets the full spin-1/2 treatment
+        :param threads: number of threads diagonalizing Mz blocks at the
+        same time (see parallel_eigh); None for all CPUs
+    :returns: a (frequencies, intensities) tuple of 1D numpy arrays
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    couplings = np.asarray(couplings, dtype=float)
+    nspins = len(freqs)
+    frequencies, intensities = [], []
+    for cluster in spin_clusters(couplings):
+        k = len(cluster)
+        v_cluster = freqs[cluster]
+        J_cluster = couplings[np.ix_(cluster, cluster)]
+        groups = (equivalent_groups(v_cluster, J_cluster) if equivalence
+                  else [])
+        if 0 < len(groups) < k:
+            first = [group[0] for group in groups]
+            v, I = composite_signals(v_cluster[first],
+                                     [len(group) for group in groups],
+                                     J_cluster[np.ix_(first, first)],
+                                     cutoff)
+        else:
+            H = hamiltonian_bitwise(v_cluster, J_cluster, sparse=True)
+            v, I = block_signals(mz_eigensystems(H, k, threads), k, cutoff)
+        frequencies.append(v)
+        intensities.append(I * 2 ** (nspins - k))
+    return np.concatenate(frequencies), np.concatenate(intensities)
+
+
+def nspinspec(freqs, couplings, cutoff=0.01, equivalence=True, threads=1):
     """
     Function that calculates a spectrum for n spin-half nuclei.
     Inputs:
@@ -175,10 +647,15 @@ def nspinspec(freqs, couplings):
         of nuclei in the list corresponds to the column and row order in the
         matrix, e.g. couplings[0][1] and [1]0] are the J coupling between
         the nuclei of freqs[0] and freqs [1].
+        :param cutoff: minimum intensity for a transition to be reported
+        :param equivalence: detect magnetically equivalent nuclei (see
+        nspinsignals)
+        :param threads: number of threads diagonalizing Mz blocks at the
+        same time (see parallel_eigh); None for all CPUs
     Returns:
     -spectrum: a list of (frequency, intensity) tuples.
-    Dependencies: hamiltonian, simsignals
+    Dependencies: nspinsignals
     """
-    nspins = len(freqs)
-    H = hamiltonian(freqs, couplings)
-    return simsignals(H, nspins)
+    frequencies, intensities = nspinsignals(freqs, couplings, cutoff,
+                                            equivalence, threads)
+    return list(zip(frequencies.tolist(), intensities.tolist()))
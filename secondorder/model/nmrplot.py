@@ -5,6 +5,7 @@ lineshapes for plotting.
 
 #import matplotlib.pyplot as plt
 import numpy as np
+from scipy.signal import fftconvolve
 
 
 def lorentz(v, v0, I, w):
@@ -20,6 +21,35 @@ def lorentz(v, v0, I, w):
     return I * ((0.5 * w) ** 2 / ((0.5 * w) ** 2 + (v - v0) ** 2))
 
 
+def gaussian(v, v0, I, w):
+    """
+    A gaussian function that takes linewidth at half intensity (w) as a
+    parameter.
+    :param v: Array of values at which to evaluate distribution.
+    :param v0: Center of the distribution.
+    :param I: Peak height.
+    :param w: Peak width at half max intensity
+
+    :returns: Distribution evaluated at points in x.
+    """
+    return I * np.exp(-4 * np.log(2) * (v - v0) ** 2 / w ** 2)
+
+
+def grid_step(linspace):
+    """
+    Returns the spacing of evenly spaced x coordinates.
+
+    :param linspace: a sorted numpy array of x coordinates
+    :returns: the spacing between consecutive coordinates
+    :raises ValueError: if the coordinates are not evenly spaced
+    """
+    x = np.asarray(linspace, dtype=float)
+    dx = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 0
+    if not dx > 0 or not np.allclose(np.diff(x), dx, rtol=1e-6, atol=0):
+        raise ValueError('x coordinates must be sorted and evenly spaced')
+    return dx
+
+
 def add_signals(linspace, peaklist, w):
     """
     Given a numpy linspace a spectrum as a list of (frequency, intensity)
@@ -37,6 +67,187 @@ def add_signals(linspace, peaklist, w):
     return result
 
 
+def add_signals_windowed(linspace, peaklist, w, widths=50, tail=False,
+                         chunk=2 ** 16, loop_width=256):
+    """
+    A faster add_signals for long peak lists. Each Lorentzian is only
+    evaluated within +/- widths * w of its center, found with searchsorted
+    on the sorted peaks, and accumulated into one preallocated array, so the
+    cost grows as peaks x points-per-window instead of peaks x points.
+
+    Without tail correction, each point misses the Lorentzian tails of
+    peaks farther than widths * w away, i.e. less than
+    I / (4 * widths**2 + 1) per peak.
+
+    With tail=True (which requires evenly spaced x coordinates), windows are
+    centered on the grid point nearest each peak, and the missing tails are
+    added by convolving the binned intensities with the Lorentzian outside
+    the window (with an FFT). The only error left is from moving each
+    peak's tail by at most half a grid step, a relative error of at most
+    1 / (2 * widths * w / dx) of a tail that is already small.
+
+    :param linspace: a sorted numpy array of x coordinates for the lineshape
+    :param peaklist: a list of (frequency, intensity) tuples, or an (n, 2)
+    array
+    :param w: peak width at half maximum intensity
+    :param widths: half-width of the window around each peak, in units of w
+    :param tail: add the Lorentzian tails beyond the windows
+    :param chunk: maximum number of (peak, point) pairs evaluated at once
+    :param loop_width: windows wider than this many points are added one
+    peak at a time instead of in vectorized chunks
+    :returns: array of y coordinates for the lineshape
+    """
+    x = np.asarray(linspace, dtype=float)
+    peaks = np.asarray(peaklist, dtype=float).reshape(-1, 2)
+    peaks = peaks[np.argsort(peaks[:, 0], kind='stable')]
+    v, I = peaks[:, 0], peaks[:, 1]
+    result = np.zeros(len(x))
+    if not len(peaks) or not len(x):
+        return result
+    half = widths * w
+
+    if tail:
+        dx = grid_step(x)
+        m = int(np.ceil(half / dx))
+        centers = np.rint((v - x[0]) / dx).astype(int)
+        lo = np.clip(centers - m, 0, len(x))
+        hi = np.clip(centers + m + 1, 0, len(x))
+    else:
+        lo = np.searchsorted(x, v - half, side='left')
+        hi = np.searchsorted(x, v + half, side='right')
+
+    hw2 = (0.5 * w) ** 2
+    widest = int(np.max(hi - lo))
+    if widest > loop_width:
+        # Long windows: a loop over peaks costs little per point
+        for v0, I0, start, stop in zip(v, I, lo, hi):
+            d = x[start:stop] - v0
+            d *= d
+            d += hw2
+            np.divide(I0 * hw2, d, out=d)
+            result[start:stop] += d
+    else:
+        # Short windows: evaluate (peak, window point) pairs in chunks of
+        # sorted, and so nearby, peaks
+        per_chunk = max(1, chunk // max(1, widest))
+        for start in range(0, len(peaks), per_chunk):
+            stop = start + per_chunk
+            lo_c, hi_c = lo[start:stop], hi[start:stop]
+            indices = lo_c[:, np.newaxis] + np.arange(np.max(hi_c - lo_c))
+            outside = indices >= hi_c[:, np.newaxis]
+            indices[outside] = lo_c.min()  # in range; value set to 0 below
+            d = x[indices] - v[start:stop, np.newaxis]
+            values = I[start:stop, np.newaxis] * (hw2 / (hw2 + d * d))
+            values[outside] = 0
+            result += np.bincount(indices.ravel(), weights=values.ravel(),
+                                  minlength=len(x))
+
+    if tail and 2 * m + 1 < len(x) + np.ptp(centers):
+        first = min(centers[0], 0)
+        last = max(centers[-1], len(x) - 1)
+        binned = np.bincount(centers - first, weights=I,
+                             minlength=last - first + 1)
+        offsets = np.arange(-(len(binned) - 1), len(binned)) * dx
+        kernel = lorentz(offsets, 0, 1, w)
+        kernel[np.abs(np.arange(len(kernel)) - (len(binned) - 1)) <= m] = 0
+        tails = fftconvolve(binned, kernel)
+        start = len(binned) - 1 - first
+        result += tails[start:start + len(x)]
+    return result
+
+
+
+def _kernels(offsets, w, shape):
+    """Returns the lineshape function of unit height centered at 0, and its
+    first and second derivatives, evaluated at offsets."""
+    if shape == 'lorentzian':
+        h = (0.5 * w) ** 2
+        denominator = h + offsets ** 2
+        K = h / denominator
+        return (K,
+                -2 * h * offsets / denominator ** 2,
+                h * (6 * offsets ** 2 - 2 * h) / denominator ** 3)
+    if shape == 'gaussian':
+        a = 4 * np.log(2) / w ** 2
+        K = np.exp(-a * offsets ** 2)
+        return K, -2 * a * offsets * K, (4 * a ** 2 * offsets ** 2 - 2 * a) * K
+    raise ValueError("shape must be 'lorentzian' or 'gaussian'")
+
+
+def add_signals_fft(linspace, peaklist, w, placement='linear',
+                    shape='lorentzian'):
+    """
+    Renders a stick spectrum by binning the peaks onto the (evenly spaced)
+    x coordinates and convolving once with the lineshape, using an FFT. The
+    cost is O(N log N) for N grid points (plus the span of any peaks beyond
+    the grid), whatever the number of peaks, and the full tails of every
+    line are included.
+
+    Placement of each peak between the grid points, and the largest error
+    per peak of height I compared with the exact sum (add_signals for a
+    lorentzian), for grid spacing dx:
+
+    * 'nearest': the peak is moved to the nearest grid point.
+      Error < 0.75 * I * dx / w.
+    * 'linear': the intensity is split between the two nearest grid points
+      in proportion to their closeness (cloud-in-cell), so the lineshape is
+      linearly interpolated. Error <= I * (dx / w)**2.
+    * 'taylor': the peak is binned at the nearest grid point together with
+      its offset moments I * delta and I * delta**2 / 2, which are
+      convolved with the first and second derivatives of the lineshape.
+      Error < 2.5 * I * (dx / w)**3.
+
+    Errors of different peaks can add up at a point, so a bound for the
+    whole spectrum is the sum of the peak intensities times the above.
+
+    :param linspace: evenly spaced, sorted numpy array of x coordinates
+    :param peaklist: a list of (frequency, intensity) tuples, or an (n, 2)
+    array
+    :param w: peak width at half maximum intensity
+    :param placement: 'nearest', 'linear' or 'taylor'
+    :param shape: 'lorentzian' or 'gaussian' (see lorentz and gaussian)
+    :returns: array of y coordinates for the lineshape
+    """
+    x = np.asarray(linspace, dtype=float)
+    peaks = np.asarray(peaklist, dtype=float).reshape(-1, 2)
+    if placement not in ('nearest', 'linear', 'taylor'):
+        raise ValueError("placement must be 'nearest', 'linear' or 'taylor'")
+    if not len(peaks) or not len(x):
+        _kernels(np.zeros(0), w, shape)  # validates shape
+        return np.zeros(len(x))
+    dx = grid_step(x) if len(x) > 1 else max(w, 1.0)
+    v, I = peaks[:, 0], peaks[:, 1]
+    position = (v - x[0]) / dx
+    if placement == 'linear':
+        base = np.floor(position).astype(int)
+    else:
+        base = np.rint(position).astype(int)
+    fraction = position - base
+
+    first = min(base.min(), 0)
+    last = max(base.max() + 1, len(x) - 1)
+    size = last - first + 1
+    index = base - first
+    K, dK, d2K = _kernels(np.arange(-(size - 1), size) * dx, w, shape)
+
+    if placement == 'nearest':
+        terms = [(np.bincount(index, I, size), K)]
+    elif placement == 'linear':
+        binned = (np.bincount(index, I * (1 - fraction), size)
+                  + np.bincount(index + 1, I * fraction, size + 1)[:size])
+        terms = [(binned, K)]
+    else:
+        delta = fraction * dx
+        terms = [(np.bincount(index, I, size), K),
+                 (np.bincount(index, I * delta, size), -dK),
+                 (np.bincount(index, I * delta ** 2 / 2, size), d2K)]
+
+    start = size - 1 - first
+    result = np.zeros(len(x))
+    for binned, kernel in terms:
+        result += fftconvolve(binned, kernel)[start:start + len(x)]
+    return result
+
 
 # scheduled for deletion
 # def lorentz2(v, v0, I, Q=1):
@@ -75,12 +286,78 @@ def add_signals(linspace, peaklist, w):
 #     return x, y
 
 
-def tkplot(spectrum, w=0.5):
+# Offsets (in linewidths) of the points added around each narrow peak. They
+# include the peak top and the half-height points.
+PEAK_STENCIL = np.array([0, 0.125, 0.25, 0.5, 0.75, 1, 1.5, 2.5, 4])
+PEAK_STENCIL = np.concatenate((-PEAK_STENCIL[:0:-1], PEAK_STENCIL))
+
+
+def plot_grid(frequencies, w, pixels=2400, points=None, per_width=10,
+              limits=None):
+    """
+    Chooses the x coordinates for plotting a spectrum with linewidth w.
+    The range is the spectrum plus a margin of max(50, 10 * w) Hz on each
+    side, or limits if given. The grid is evenly spaced with per_width
+    points per linewidth, but no more than pixels points. If the lines are
+    too narrow for that, points around each peak (see PEAK_STENCIL) are
+    added to the evenly spaced grid, so that narrow lines keep their height
+    and shape while the baseline stays at display resolution.
+
+    :param frequencies: the peak frequencies in Hz
+    :param w: peak width at half maximum intensity
+    :param pixels: the width of the plot in pixels
+    :param points: if given, return this many evenly spaced points instead
+    :param per_width: points per linewidth needed to draw a line smoothly
+    :param limits: (left, right) x range to plot, e.g. a zoomed view, or
+    None to fit the spectrum
+    :returns: (x, evenly_spaced) tuple of the sorted x coordinates and
+    whether they are evenly spaced
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    if limits is None:
+        margin = max(50, 10 * w)
+        l_limit = frequencies.min() - margin
+        r_limit = frequencies.max() + margin
+    else:
+        l_limit, r_limit = sorted(limits)
+    if points is not None:
+        return np.linspace(l_limit, r_limit, points), True
+    needed = int(np.ceil((r_limit - l_limit) * per_width / w)) + 1
+    x = np.linspace(l_limit, r_limit, min(needed, pixels))
+    if needed <= pixels:
+        return x, True
+    peak_points = (frequencies[:, np.newaxis] + w * PEAK_STENCIL).ravel()
+    peak_points = peak_points[(peak_points > l_limit)
+                              & (peak_points < r_limit)]
+    return np.unique(np.concatenate((x, peak_points))), False
+
+
+def tkplot(spectrum, w=0.5, pixels=2400, points=None, limits=None,
+           widths=50):
+    """
+    Converts a spectrum to x, y coordinates of its lineshape for plotting.
+
+    :param spectrum: a list of (frequency, intensity) tuples (sorted in
+    place)
+    :param w: peak width at half maximum intensity
+    :param pixels: the width of the plot in pixels (see plot_grid)
+    :param points: a fixed number of evenly spaced x coordinates, or None
+    to choose the grid from w, the spectral width and pixels
+    :param limits: (left, right) x range to render, e.g. the visible part
+    of a zoomed plot, or None for the whole spectrum. Peaks more than
+    widths * w outside limits are left out.
+    :param widths: window half-width in linewidths (see
+    add_signals_windowed)
+    :returns: (x, y) tuple of numpy arrays
+    """
     spectrum.sort()
-    r_limit = spectrum[-1][0] + 50
-    l_limit = spectrum[0][0] - 50
-    x = np.linspace(l_limit, r_limit, 2400)
-    y = add_signals(x, spectrum, w)
+    x, evenly_spaced = plot_grid([v for v, _ in spectrum], w, pixels,
+                                 points, limits=limits)
+    if limits is not None:
+        # Keeps the tail correction's bins within a few pixel widths
+        spectrum = [(v, I) for v, I in spectrum
+                    if x[0] - widths * w <= v <= x[-1] + widths * w]
+    y = add_signals_windowed(x, spectrum, w, widths, tail=evenly_spaced)
     return x, y
 
 # nmr plot function retained for now--may be useful for tests.
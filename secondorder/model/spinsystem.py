@@ -0,0 +1,204 @@
+"""
+A spin system object whose Hamiltonian is updated incrementally.
+
+The Hamiltonian of a spin-1/2 system is block-diagonal by total Mz. Within
+each block it is the sum of a coupling part, which only depends on J, and a
+Zeeman part, which is diagonal in the product basis. SpinSystem keeps both
+parts for every block, so that:
+
+* changing one frequency only updates the Zeeman diagonals, and
+* changing one coupling adds the change times that pair's I1.I2 operator
+  elements (whose positions are precomputed in nmrmath.spin_basis).
+
+GUI edits of a single variable and parameter sweeps over one variable then
+skip rebuilding the Hamiltonian.
+
+For small changes (e.g. while a spinbox arrow is held down), SpinSystem can
+also reuse the previous eigenvectors instead of diagonalizing again; see
+perturbed_eigh.
+"""
+
+import numpy as np
+
+from secondorder.model.nmrmath import block_signals, spin_basis
+
+
+def perturbed_eigh(H, E, V, tolerance=0.01):
+    """
+    Updates an eigensystem for a small change in a symmetric matrix.
+    H is rotated into the previous eigenbasis V, where it is nearly
+    diagonal, and the eigenvectors get a first-order (and the eigenvalues
+    a second-order) perturbation correction.
+
+    The error estimate is the largest first-order mixing coefficient
+    |H'_ij / (H'_jj - H'_ii)| in the rotated matrix H'. The corrected
+    eigenvectors (and so intensities) are then accurate to about the square
+    of the estimate.
+
+    :param H: the new symmetric matrix
+    :param E: the previous eigenvalues
+    :param V: the previous eigenvectors (columns)
+    :param tolerance: the largest acceptable error estimate
+    :returns: an (E, V) tuple, with eigenvalues in ascending order, or None
+    if the error estimate exceeds tolerance (a full solve is needed)
+    """
+    H_rotated = V.T @ H @ V
+    E_first = np.diag(H_rotated)
+    off = H_rotated - np.diag(E_first)
+    gaps = E_first[np.newaxis, :] - E_first[:, np.newaxis]
+    coupled = off != 0
+    if np.any(coupled & (np.abs(gaps) <= np.abs(off) / tolerance)):
+        return None  # also catches (near-)degenerate, mixed states
+    mixing = np.divide(off, gaps, out=np.zeros_like(off), where=coupled)
+
+    E_new = E_first - np.sum(off * mixing, axis=1)
+    V_new = V @ (np.eye(len(E)) + mixing)
+    V_new /= np.linalg.norm(V_new, axis=0)
+    order = np.argsort(E_new, kind='stable')
+    return E_new[order], V_new[:, order]
+
+
+class SpinSystem:
+    """An n-spin-1/2 system with an incrementally updated Hamiltonian.
+
+    Diagonal elements of the coupling matrix are ignored (they only add a
+    constant to every energy).
+
+    If a tolerance is given, eigensystems() reuses the previous eigenbasis
+    (see perturbed_eigh) whenever the error estimate is within tolerance,
+    and only diagonalizes again when it is not, or after `refresh`
+    consecutive perturbative updates. The numbers of full and perturbative
+    solves are counted in full_solves and warm_solves.
+
+    Example:
+        system = SpinSystem(v, J)
+        system.set_frequency(0, 120)
+        system.set_coupling(0, 1, 7.5)
+        peaklist = system.spectrum()
+    """
+    def __init__(self, freqs, couplings, tolerance=None, refresh=20):
+        """
+        Arguments:
+            freqs: a list of n nuclei frequencies in Hz
+            couplings: an n x n array of couplings in Hz (symmetrized as in
+            nmrmath.hamiltonian)
+            tolerance: None to always diagonalize, or the error estimate
+            accepted for perturbative updates (see perturbed_eigh)
+            refresh: maximum number of consecutive perturbative updates of
+            a block before it is diagonalized again
+        """
+        freqs = np.array(freqs, dtype=float).ravel()
+        self.nspins = len(freqs)
+        self.tolerance = tolerance
+        self.refresh = refresh
+        self.previous = None  # last result of eigensystems()
+        self.warm_counts = [0] * (self.nspins + 1)
+        self.full_solves = 0
+        self.warm_solves = 0
+        self.basis = spin_basis(self.nspins)
+        self.freqs = np.zeros(self.nspins)
+        self.couplings = np.zeros((self.nspins, self.nspins))
+        self.rebuild()
+        self.update(freqs, couplings)
+
+    def set_frequency(self, i, v):
+        """Sets the frequency of nucleus i to v Hz."""
+        delta = v - self.freqs[i]
+        if delta == 0:
+            return
+        for indices, zeeman in zip(self.basis.blocks, self.zeeman):
+            zeeman += delta * self.basis.mz[indices, i]
+        self.freqs[i] = v
+
+    def set_coupling(self, i, j, J):
+        """Sets the coupling between nuclei i and j (i != j) to J Hz."""
+        if i == j:
+            return
+        i, j = min(i, j), max(i, j)
+        delta = J - self.couplings[i, j]
+        if delta == 0:
+            return
+        basis = self.basis
+        mz = basis.mz
+        rows, cols = basis.flipflops[i, j]
+        for k, (indices, block) in enumerate(zip(basis.blocks,
+                                                 self.coupling_blocks)):
+            # Iz_i Iz_j on the diagonal...
+            block[np.diag_indices(len(indices))] += (
+                delta * mz[indices, i] * mz[indices, j])
+            # ...and (I+I- + I-I+)/2 between the flip-flop partners
+            in_block = basis.weight[rows] == k
+            block[basis.position[rows[in_block]],
+                  basis.position[cols[in_block]]] += 0.5 * delta
+        self.couplings[i, j] = self.couplings[j, i] = J
+
+    def update(self, freqs, couplings):
+        """Sets all frequencies and couplings, applying only the changes.
+
+        Arguments:
+            freqs: a list of n nuclei frequencies in Hz
+            couplings: an n x n array of couplings in Hz
+        """
+        freqs = np.asarray(freqs, dtype=float).ravel()
+        J = np.asarray(couplings, dtype=float)
+        J = 0.5 * (J + J.T)
+        for i in np.flatnonzero(freqs != self.freqs):
+            self.set_frequency(i, freqs[i])
+        changed = np.triu(J != self.couplings, 1)
+        for i, j in zip(*np.nonzero(changed)):
+            self.set_coupling(i, j, J[i, j])
+
+    def rebuild(self):
+        """Recomputes the Hamiltonian blocks from scratch, discarding any
+        rounding error accumulated by incremental updates."""
+        freqs, couplings = self.freqs, self.couplings
+        self.freqs = np.zeros(self.nspins)
+        self.couplings = np.zeros((self.nspins, self.nspins))
+        self.zeeman = [np.zeros(len(indices))
+                       for indices in self.basis.blocks]
+        self.coupling_blocks = [np.zeros((len(indices), len(indices)))
+                                for indices in self.basis.blocks]
+        self.update(freqs, couplings)
+
+    def hamiltonian_blocks(self):
+        """Returns a list of (indices, H) tuples: the basis states and the
+        dense Hamiltonian of each Mz block."""
+        return [(indices, block + np.diag(zeeman))
+                for indices, block, zeeman in zip(self.basis.blocks,
+                                                  self.coupling_blocks,
+                                                  self.zeeman)]
+
+    def eigensystems(self):
+        """Diagonalizes each Mz block.
+
+        Returns: a list of (indices, E, V) tuples, as returned by
+        nmrmath.mz_eigensystems.
+        """
+        blocks = []
+        for k, (indices, H) in enumerate(self.hamiltonian_blocks()):
+            result = None
+            if (self.tolerance is not None and self.previous is not None
+                    and self.warm_counts[k] < self.refresh):
+                _, E, V = self.previous[k]
+                result = perturbed_eigh(H, E, V, self.tolerance)
+            if result is None:
+                result = np.linalg.eigh(H)
+                self.warm_counts[k] = 0
+                self.full_solves += 1
+            else:
+                self.warm_counts[k] += 1
+                self.warm_solves += 1
+            blocks.append((indices, *result))
+        self.previous = blocks
+        return blocks
+
+    def signals(self, cutoff=0.01):
+        """Returns a (frequencies, intensities) tuple of 1D numpy arrays
+        (see nmrmath.block_signals)."""
+        return block_signals(self.eigensystems(), self.nspins, cutoff)
+
+    def spectrum(self, cutoff=0.01):
+        """Returns the spectrum as a list of (frequency, intensity) tuples,
+        like nmrmath.nspinspec."""
+        frequencies, intensities = self.signals(cutoff)
+        return list(zip(frequencies.tolist(), intensities.tolist()))
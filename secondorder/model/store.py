@@ -0,0 +1,225 @@
+"""
+A persistent, content-addressed store of simulation results on disk.
+
+Results are keyed by a hash of the spin system that does not depend on the
+order in which the nuclei are listed, and saved as compressed .npz files.
+Several processes (or machines sharing a file system) can use the same
+store directory at once: files are written under a temporary name and
+atomically renamed into place, and a reader only ever sees complete files.
+
+Contains:
+
+* canonical_spinsystem  Puts the nuclei of a spin system in a standard order.
+* canonical_key         Permutation-invariant hash of a spin system.
+* SpectrumStore         The store, with size-based LRU eviction.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from secondorder.model.nmrmath import nspinsignals
+
+
+def canonical_spinsystem(v, j):
+    """
+    Reorders the nuclei of a spin system by frequency, breaking ties by
+    each nucleus's sorted list of couplings.
+    Two listings of the same spin system in different orders usually give
+    identical results. When they do not (e.g. nuclei with identical
+    frequencies and coupling sets but a different coupling topology), the
+    result is still a valid relabeling of the same system, so a cache keyed
+    on it can miss but never return the wrong spectrum.
+
+    :param v: a 1-D array of n frequencies
+    :param j: an n x n array of couplings
+    :returns: (v, j) tuple of float64 arrays in canonical order, with j
+    symmetrized
+    """
+    v = np.asarray(v, dtype=np.float64).ravel() + 0.0  # -0.0 becomes 0.0
+    j = np.asarray(j, dtype=np.float64)
+    j = 0.5 * (j + j.T) + 0.0
+    order = sorted(range(len(v)),
+                   key=lambda i: (v[i], tuple(np.sort(j[i]))))
+    return v[order], j[np.ix_(order, order)]
+
+
+def canonical_key(v, j, tag=''):
+    """
+    Computes a hash of a spin system that is the same for any ordering of
+    its nuclei (see canonical_spinsystem).
+
+    :param v: a 1-D array of n frequencies
+    :param j: an n x n array of couplings
+    :param tag: a string identifying how the result was calculated (e.g.
+    the function and its options), included in the hash
+    :returns: a hex digest string
+    """
+    v, j = canonical_spinsystem(v, j)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(tag.encode())
+    digest.update(np.int64(len(v)).tobytes())
+    digest.update(np.ascontiguousarray(v).tobytes())
+    digest.update(np.ascontiguousarray(j).tobytes())
+    return digest.hexdigest()
+
+
+class SpectrumStore:
+    """A directory of (frequencies, intensities) results, one compressed .npz
+    file per spin system, with least-recently-used eviction once the total
+    size exceeds max_bytes.
+
+    Listing the store costs time proportional to its number of entries, so
+    put() does not list it every time. Each SpectrumStore object keeps a
+    running estimate of the total size (listed once, then increased by each
+    put), and only lists the store to evict when the estimate exceeds
+    max_bytes. Eviction then goes down to low_water * max_bytes, so that it
+    is not needed again for a while. Entries written by other processes are
+    only counted at the next listing, so a store shared by several processes
+    can briefly exceed max_bytes.
+
+    Example:
+        store = SpectrumStore('~/.secondorder/spectra')
+        frequencies, intensities = store.nspinsignals(v, j)
+    """
+    suffix = '.npz'
+
+    def __init__(self, directory, max_bytes=2 ** 30, low_water=0.8):
+        """
+        Arguments:
+            directory: path of the store; created if it does not exist
+            max_bytes: total size above which the least recently used
+            entries are deleted
+            low_water: fraction of max_bytes that eviction by put() goes
+            down to
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.estimated_bytes = None  # listed on the first put
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        """Returns the file path for key. Files are spread over 256
+        subdirectories named after the first two characters of the key."""
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """Returns the stored (frequencies, intensities) arrays for key, or
+        None if there is no (readable) entry."""
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                result = data['frequencies'], data['intensities']
+        except (OSError, KeyError, ValueError):
+            # Missing, evicted by another process, or unreadable
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, frequencies, intensities):
+        """Stores the (frequencies, intensities) arrays for key, then evicts
+        old entries if the estimated size is over the size limit."""
+        if self.estimated_bytes is None:
+            self.estimated_bytes = self.size()
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                np.savez_compressed(f,
+                                    frequencies=np.asarray(frequencies),
+                                    intensities=np.asarray(intensities))
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)  # atomic: readers see old or new
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.estimated_bytes += size - replaced
+        if self.estimated_bytes > self.max_bytes:
+            self.evict(self.low_water * self.max_bytes)
+
+    def entries(self):
+        """Returns a list of (last use time, size, path) tuples for all
+        stored entries."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+        return entries
+
+    def size(self):
+        """Returns the total size in bytes of the stored entries."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, target=None):
+        """Deletes the least recently used entries until the store is no
+        larger than target bytes (default: max_bytes). Returns the number of
+        entries deleted."""
+        if target is None:
+            target = self.max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        deleted = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                deleted += 1
+            except OSError:
+                pass  # already removed by another process, or in use
+            total -= size
+        self.estimated_bytes = total
+        return deleted
+
+    def clear(self):
+        """Deletes all stored entries."""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.estimated_bytes = 0
+
+    def nspinsignals(self, v, j, cutoff=0.01, equivalence=True):
+        """Returns nmrmath.nspinsignals(v, j, cutoff, equivalence), from the
+        store if this spin system (in any nuclei order) was simulated
+        before, and storing the result otherwise."""
+        tag = 'nspinsignals:cutoff={!r}:equivalence={!r}'.format(
+            float(cutoff), bool(equivalence))
+        key = canonical_key(v, j, tag)
+        result = self.get(key)
+        if result is None:
+            result = nspinsignals(v, j, cutoff, equivalence)
+            self.put(key, *result)
+        return result
+
+    def nspinspec(self, v, j, cutoff=0.01, equivalence=True):
+        """Store-backed version of nmrmath.nspinspec.
+
+        Returns: a list of (frequency, intensity) tuples.
+        """
+        frequencies, intensities = self.nspinsignals(v, j, cutoff,
+                                                     equivalence)
+        return list(zip(frequencies.tolist(), intensities.tolist()))
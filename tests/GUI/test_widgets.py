@@ -0,0 +1,51 @@
+import threading
+from types import SimpleNamespace
+
+from pytest import approx
+
+from secondorder.GUI.widgets import ArraySpinBox, FrameTimer
+
+
+def test_frame_timer_interval():
+    timer = FrameTimer(minimum=50, target=250, window=4)
+    assert timer.frame_time() == 0
+    assert timer.interval() == 50  # no frames yet: the minimum
+
+    timer.record(0.125)
+    timer.record(0.25)
+    assert timer.frame_time() == approx(187.5)
+    assert timer.interval() == 187  # follows the average frame time
+
+    for _ in range(4):  # only the last 4 frames are averaged
+        timer.record(0.01)
+    assert timer.frame_time() == approx(10)
+    assert timer.interval() == 50  # no faster than the minimum
+
+    for _ in range(4):
+        timer.record(2.0)
+    assert timer.interval() == 250  # no slower than the target
+
+
+def test_frame_timer_threads():
+    timer = FrameTimer(window=1000)
+
+    def record():
+        for _ in range(250):
+            timer.record(0.125)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(timer.times) == 1000
+    assert timer.interval() == 125
+
+
+def test_spinbox_refresh_interval():
+    # refresh_interval only reads frame_timer, so no Tk window is needed
+    spinbox = SimpleNamespace(frame_timer=None)
+    assert ArraySpinBox.refresh_interval(spinbox) == 50
+    spinbox.frame_timer = FrameTimer(minimum=20, target=400)
+    spinbox.frame_timer.record(0.25)
+    assert ArraySpinBox.refresh_interval(spinbox) == 250
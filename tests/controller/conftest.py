@@ -0,0 +1,24 @@
+import time
+
+import pytest
+
+
+class FakeWidget:
+    """Stands in for a tkinter widget: after() callbacks are run by
+    run_until_idle instead of a Tk main loop."""
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, function):
+        self.scheduled.append(function)
+
+    def run_until_idle(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            time.sleep(0.001)
+            self.scheduled.pop(0)()
+
+
+@pytest.fixture
+def widget():
+    return FakeWidget()
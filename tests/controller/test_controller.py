@@ -0,0 +1,157 @@
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from secondorder.initialize import getWINDNMRdefault
+from secondorder.model.nmrmath import nspinspec
+from secondorder.model.nmrplot import tkplot
+
+
+class FakeView:
+    """Records the plot calls the Controller makes, instead of drawing."""
+    def __init__(self, root, controller):
+        self.plots = []
+        self.windows = []
+        self.width = 300
+
+    def pack(self, **options):
+        pass
+
+    def initialize(self):
+        pass
+
+    def update_plot(self, x, y):
+        self.plots.append((x, y))
+
+    def plot_window(self, x, y):
+        self.windows.append((x, y))
+
+    def plot_width(self):
+        return self.width
+
+
+@pytest.fixture
+def controller(monkeypatch, widget):
+    view_module = types.ModuleType('secondorder.GUI.view')
+    view_module.View = FakeView
+    monkeypatch.setitem(sys.modules, 'secondorder.GUI.view', view_module)
+    monkeypatch.delitem(sys.modules, 'secondorder.controller.controller',
+                        raising=False)
+    module = importlib.import_module('secondorder.controller.controller')
+    controller = module.Controller(widget)  # as the Tk root
+    controller.root = widget
+    yield controller
+    controller.worker.close(5)
+    controller.window_worker.close(5)
+    sys.modules.pop('secondorder.controller.controller', None)
+
+
+def test_spinsystem_only_for_single_cluster(controller):
+    v, j = getWINDNMRdefault(4)
+    v = v[0, :]
+    np.testing.assert_array_almost_equal(
+        sorted(controller.spinsystem_spectrum(v, j)[0]), sorted(nspinspec(v, j)))
+    assert list(controller.spinsystems) == [4]
+
+    # two uncoupled ABs: simulated per cluster, without a SpinSystem
+    v2 = np.array([100.0, 120.0, 300.0, 310.0])
+    j2 = np.zeros((4, 4))
+    j2[0, 1] = j2[1, 0] = 10.0
+    j2[2, 3] = j2[3, 2] = 7.0
+    controller.spinsystems.clear()
+    np.testing.assert_array_almost_equal(
+        sorted(controller.spinsystem_spectrum(v2, j2)[0]),
+        sorted(nspinspec(v2, j2)))
+    assert not controller.spinsystems
+
+    # an A2X system has equivalent nuclei
+    v3 = np.array([100.0, 100.0, 300.0])
+    j3 = np.array([[0, 0, 7.0], [0, 0, 7.0], [7.0, 7.0, 0]])
+    controller.spinsystem_spectrum(v3, j3)
+    assert not controller.spinsystems
+
+
+def test_warm_start_results_not_cached(controller):
+    v, j = getWINDNMRdefault(4)
+    v = v[0, :]
+    peaklist, exact = controller.peaklist(v, j)
+    assert exact and controller.cache_stats()['peaks']['size'] == 1
+
+    # a small change is solved from the previous eigenvectors
+    nudged = v + np.array([0.01, 0, 0, 0])
+    peaklist, exact = controller.peaklist(nudged, j)
+    assert controller.spinsystems[4].warm_solves > 0
+    assert not exact
+    np.testing.assert_array_almost_equal(sorted(peaklist),
+                                         sorted(nspinspec(nudged, j)), 2)
+    controller.simulate(nudged, j, 0.5)
+    stats = controller.cache_stats()
+    assert stats['peaks']['size'] == 1 and stats['plots']['size'] == 0
+
+
+def test_lineshape_at_plot_width(controller):
+    v, j = getWINDNMRdefault(3)
+    v = v[0, :]
+    w = np.float64(0.5)
+    controller.update_with_dict(v, j, w)
+    controller.root.run_until_idle()
+    x, y = controller.view.plots[-1]
+    expected = tkplot(list(nspinspec(v, j)), w, pixels=300)
+    np.testing.assert_array_almost_equal(x, expected[0])
+    np.testing.assert_array_almost_equal(y, expected[1])
+
+    controller.view.width = 1200  # e.g. the window was widened
+    controller.update_with_dict(v, j, w)
+    controller.root.run_until_idle()
+    assert len(controller.view.plots[-1][0]) > len(x)
+    assert controller.cache_stats()['plots']['misses'] == 2
+
+
+def test_zoom_out_restores_full_lineshape(controller):
+    v, j = getWINDNMRdefault(4)
+    controller.update_with_dict(v[0, :], j, np.float64(0.5))
+    controller.root.run_until_idle()
+    full_x, full_y = controller.view.plots[-1]
+
+    # the whole spectrum is visible: nothing to re-render
+    controller.update_view_window(full_x[0] - 1, full_x[-1] + 1, 300)
+    controller.root.run_until_idle()
+    assert not controller.view.windows
+
+    controller.update_view_window(110, 120, 300)
+    controller.root.run_until_idle()
+    x, _ = controller.view.windows[-1]
+    assert x[0] == pytest.approx(110) and x[-1] == pytest.approx(120)
+
+    # zooming out (or Home) puts back the cached full lineshape, once
+    controller.update_view_window(full_x[-1] + 1, full_x[0] - 1, 300)
+    controller.root.run_until_idle()
+    x, y = controller.view.windows[-1]
+    assert x is full_x and y is full_y
+    controller.update_view_window(full_x[0] - 2, full_x[-1] + 2, 300)
+    controller.root.run_until_idle()
+    assert len(controller.view.windows) == 2
+
+
+def test_zoom_does_not_wait_for_simulation(controller):
+    v, j = getWINDNMRdefault(4)
+    controller.update_with_dict(v[0, :], j, np.float64(0.5))
+    controller.root.run_until_idle()
+    controller.peak_cache.clear()
+
+    # a simulation in progress holds the SpinSystem lock
+    with controller.spinsystem_lock:
+        controller.update_view_window(110, 120, 300)  # returns at once
+        assert not controller.view.windows
+    controller.root.run_until_idle()
+    x, _ = controller.view.windows[-1]
+    assert x[0] == pytest.approx(110)
+
+    # a window requested for a spectrum that is no longer plotted is dropped
+    controller.update_view_window(130, 140, 300)
+    controller.displayed = controller.displayed[:4] + (300, (0, 1000))
+    controller.root.run_until_idle()
+    assert len(controller.view.windows) == 1
@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+from secondorder.controller.worker import SimulationWorker
+
+
+def test_worker_keeps_newest_request(widget):
+    started = threading.Event()
+    release = threading.Event()
+
+    def simulate(n):
+        started.set()
+        release.wait(5)
+        return n * n
+
+    delivered = []
+    worker = SimulationWorker(widget, simulate,
+                              lambda result, n: delivered.append((n, result)))
+    worker.submit(1)
+    assert started.wait(5)
+    for n in range(2, 10):  # submitted while 1 is running
+        worker.submit(n)
+    release.set()
+    widget.run_until_idle()
+
+    assert worker.idle()
+    assert worker.completed == 2
+    assert worker.dropped == 7
+    assert delivered[-1] == (9, 81)
+    worker.close(timeout=5)
+    assert not worker.thread.is_alive()
+
+
+def test_worker_reports_errors(widget):
+    worker = SimulationWorker(widget, lambda: 1 / 0, lambda result: None)
+    worker.submit()
+    with pytest.raises(ZeroDivisionError):
+        widget.run_until_idle()
+    worker.close(timeout=5)
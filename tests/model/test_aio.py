@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+from secondorder.model import aio
+from secondorder.model.aio import AsyncSimulator
+from secondorder.model.nmrmath import nspinspec
+from secondorder.model.nmrplot import tkplot
+
+
+def ab_system():
+    return np.array([100.0, 120.0]), np.array([[0, 10.0], [10.0, 0]])
+
+
+def test_lineshape():
+    v, j = ab_system()
+
+    async def main():
+        simulator = AsyncSimulator(max_concurrent=2)
+        return (await simulator.peaklist(v, j),
+                await simulator.lineshape(v, j, 0.5),
+                simulator.peak_cache.stats())
+
+    peaklist, (x, y), stats = asyncio.run(main())
+    assert peaklist == nspinspec(v, j)
+    x_sync, y_sync = tkplot(nspinspec(v, j), 0.5)
+    np.testing.assert_array_equal(x, x_sync)
+    np.testing.assert_array_equal(y, y_sync)
+    assert stats['hits'] == 1
+
+
+def test_session_cancellation_and_limit(monkeypatch):
+    v, j = ab_system()
+    running = [0]
+    most = [0]
+    lock = threading.Lock()
+
+    def slow_simulation(v, j):
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return [(v[0], 1.0)]
+
+    monkeypatch.setitem(aio.SIMULATIONS, 'QM', slow_simulation)
+
+    async def main():
+        simulator = AsyncSimulator(max_concurrent=1)
+
+        async def request(session, shift):
+            try:
+                return await simulator.lineshape(v + shift, j, 0.5,
+                                                 session=session)
+            except asyncio.CancelledError:
+                return 'cancelled'
+
+        first = asyncio.ensure_future(request('a', 0))
+        await asyncio.sleep(0)  # let the first request start
+        results = await asyncio.gather(first, request('a', 1),
+                                       request('b', 2))
+        return results, simulator.sessions
+
+    results, sessions = asyncio.run(main())
+    assert results[0] == 'cancelled'  # superseded by the second request
+    assert all(isinstance(result, tuple) for result in results[1:])
+    assert sessions == {}
+    assert most[0] == 1
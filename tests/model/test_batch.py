@@ -0,0 +1,33 @@
+import numpy as np
+from secondorder.model import batch
+from secondorder.model.nmrmath import hamiltonian_bitwise, simsignals
+
+
+def random_systems(B, n, seed=0):
+    rng = np.random.default_rng(seed)
+    v = rng.uniform(0, 300, (B, n))
+    J = np.triu(rng.uniform(-15, 15, (B, n, n)), 1)
+    return v, J + J.transpose(0, 2, 1)
+
+
+def test_batch_hamiltonian_blocks():
+    v, J = random_systems(3, 4)
+    H_blocks = batch.batch_hamiltonian_blocks(v, J)
+    assert [H.shape for H in H_blocks] == [(3, 1, 1), (3, 4, 4), (3, 6, 6),
+                                           (3, 4, 4), (3, 1, 1)]
+    H = hamiltonian_bitwise(v[1], J[1])
+    np.testing.assert_array_almost_equal(H_blocks[2][1],
+                                         H[np.ix_([3, 5, 6, 9, 10, 12],
+                                                  [3, 5, 6, 9, 10, 12])])
+
+
+def test_batch_signals():
+    v, J = random_systems(20, 4)
+    frequencies, intensities, offsets = batch.batch_signals(v, J)
+    assert len(offsets) == 21
+    assert offsets[-1] == len(frequencies) == len(intensities)
+    for b, peaklist in enumerate(batch.unpack(frequencies, intensities,
+                                              offsets)):
+        reference = simsignals(hamiltonian_bitwise(v[b], J[b]), 4)
+        np.testing.assert_array_almost_equal(sorted(peaklist),
+                                             sorted(reference))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from secondorder.model.bulk import BulkReader, BulkWriter
+from secondorder.model.nmrmath import nspinspec
+from secondorder.model.nmrplot import tkplot
+
+
+def systems(count):
+    for n in range(count):
+        v = np.array([100.0 + n, 120.0, 300.0])[:2 + n % 2]
+        j = np.full((len(v), len(v)), 7.0 + n)
+        yield 'system {}'.format(n), v, j
+
+
+def test_bulk_store(tmp_path):
+    directory = tmp_path / 'campaign'
+    expected = {}
+    with BulkWriter(directory, points=500, capacity=2,
+                    peak_capacity=3) as writer:
+        for system_id, v, j in list(systems(5))[:3]:
+            peaklist = nspinspec(v, j)
+            x, y = tkplot(list(peaklist), 0.5, points=500)
+            assert writer.append(system_id, peaklist, x, y) == len(expected)
+            expected[system_id] = (peaklist, x, y)
+        with pytest.raises(ValueError):
+            writer.append('system 0', peaklist, x, y)
+        with pytest.raises(ValueError):
+            writer.append('short', peaklist, x[:10], y[:10])
+
+    # Reopening appends after the existing rows
+    with BulkWriter(directory, points=500) as writer:
+        for system_id, v, j in list(systems(5))[3:]:
+            peaklist = nspinspec(v, j)
+            x, y = tkplot(list(peaklist), 0.5, points=500)
+            writer.append(system_id, peaklist, x, y)
+            expected[system_id] = (peaklist, x, y)
+    with pytest.raises(ValueError):
+        BulkWriter(directory, points=100)
+
+    results = BulkReader(directory)
+    assert len(results) == 5 and 'system 4' in results
+    assert results.spectra.shape == (5, 500)
+    for system_id, (peaklist, x, y) in expected.items():
+        x_read, y_read = results.spectrum(system_id)
+        np.testing.assert_allclose(x_read, x)
+        np.testing.assert_array_equal(y_read, y)
+        np.testing.assert_array_equal(results.peaklist(system_id), peaklist)
+    _, y_read = results.spectrum('system 1')
+    assert isinstance(y_read, np.memmap)  # a view, not a copy
+
+
+def test_bulk_store_flush_every(tmp_path):
+    directory = tmp_path / 'campaign'
+    with BulkWriter(directory, points=200, flush_every=2) as writer:
+        for count, (system_id, v, j) in enumerate(systems(3), 1):
+            peaklist = nspinspec(v, j)
+            x, y = tkplot(list(peaklist), 0.5, points=200)
+            writer.append(system_id, peaklist, x, y)
+            # readers see the rows up to the last automatic flush
+            assert len(BulkReader(directory)) == count // 2 * 2
+    assert len(BulkReader(directory)) == 3
@@ -0,0 +1,26 @@
+import numpy as np
+from secondorder.model.cache import LRUCache, spectrum_key
+
+
+def test_spectrum_key():
+    v = np.array([100, 110])
+    j = np.array([[0, 12], [12, 0]])
+    key = spectrum_key(v, j, 0.5)
+    assert spectrum_key([100.0, 110.0], np.matrix(j), 0.5) == key
+    assert spectrum_key(v, np.array([[0, 12], [-0.0 + 12, 0]]), 0.5) == key
+    assert spectrum_key(v, j, 1.0) != key
+    assert spectrum_key(v, j, 0.5, 'FO') != key
+    assert spectrum_key(v, j) == spectrum_key(v, j, None)
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert len(cache) == 2
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1,
+                             'size': 2, 'maxsize': 2}
@@ -0,0 +1,73 @@
+import numpy as np
+from pytest import approx
+from secondorder.model import firstorder
+from secondorder.model.nmrmath import nspinsignals
+
+
+def lineshape(signals, x, w=0.5):
+    v, I = signals
+    return np.sum(I * (0.5 * w) ** 2
+                  / ((0.5 * w) ** 2 + (x[:, np.newaxis] - v) ** 2), axis=1)
+
+
+def abx_system():
+    """A strongly coupled AB pair weakly coupled to a distant X nucleus"""
+    freqs = np.array([100, 110, 1000])
+    J = np.zeros((3, 3))
+    J[0, 1] = 12
+    J[0, 2] = 4
+    return freqs, J + J.T
+
+
+def test_first_order_signals():
+    """A first-order AX2 system: a 1:2:1 triplet and a 1:1 doublet"""
+    freqs = [100, 300, 300]
+    J = np.zeros((3, 3))
+    J[0, 1:] = 7
+    J = J + J.T
+    v, I = firstorder.first_order_signals(freqs, J)
+    np.testing.assert_array_almost_equal(v, [93, 100, 107, 296.5, 303.5,
+                                             296.5, 303.5])
+    np.testing.assert_array_almost_equal(I, [1, 2, 1, 2, 2, 2, 2])
+    assert I.sum() == approx(3 * 2 ** 2)  # same scale as nspinsignals
+
+
+def test_first_order_signals_isochronous():
+    """In A2X, the coupling between the A nuclei is not observed: A is a
+    1:1 doublet, as in the quantum-mechanical spectrum"""
+    freqs = [100, 100, 1000]
+    J = np.array([[0, -12, 7], [-12, 0, 7], [7, 7, 0]])
+    v, I = firstorder.first_order_signals(freqs, J)
+    a = v < 500
+    np.testing.assert_array_almost_equal(v[a], [96.5, 103.5, 96.5, 103.5])
+    np.testing.assert_array_almost_equal(I[a], [2, 2, 2, 2])
+    qm_v, qm_I = nspinsignals(freqs, J)
+    strong = (qm_v < 500) & (qm_I > 0.5)
+    assert np.unique(np.round(qm_v[strong], 1)) == approx([96.5, 103.5],
+                                                          abs=0.1)
+
+
+def test_strong_coupling_groups():
+    freqs, J = abx_system()
+    groups = firstorder.strong_coupling_groups(freqs, J, threshold=0.1)
+    assert [list(g) for g in groups] == [[0, 1], [2]]
+
+
+def test_hybrid_signals():
+    freqs, J = abx_system()
+    x = np.linspace(50, 1050, 20000)
+    exact = lineshape(nspinsignals(freqs, J, cutoff=0), x)
+    hybrid = lineshape(firstorder.hybrid_signals(freqs, J, cutoff=0), x)
+    first_order = lineshape(firstorder.first_order_signals(freqs, J), x)
+    assert np.abs(hybrid - exact).max() < 0.05 * exact.max()
+    assert np.abs(first_order - exact).max() > 0.1 * exact.max()
+
+
+def test_auto_signals():
+    freqs, J = abx_system()
+    v, I = firstorder.auto_signals(freqs, J, threshold=0.001)
+    exact = nspinsignals(freqs, J)
+    np.testing.assert_array_almost_equal(np.sort(v), np.sort(exact[0]))
+    v, I = firstorder.auto_signals(freqs, J, threshold=10)
+    np.testing.assert_array_almost_equal(
+        v, firstorder.first_order_signals(freqs, J)[0])
@@ -2,6 +2,7 @@ from secondorder.model.nmrmath import *
 import numpy as np
 from scipy.sparse import lil_matrix
 from scipy.linalg import eigh
+from pytest import approx
 
 # The attempt to put pytest code in a class failed. For whatever reason,
 # pytest could not detect the tests within the class. Reserved for potential
@@ -159,3 +160,204 @@ def test_simsignals():
     testspec = sorted(simsignals(H, 3))
     np.testing.assert_array_almost_equal(testspec, refspec, decimal=2)
 
+
+
+def rioux_system():
+    """The 3-spin system from the Frank Rioux PDF used in the tests above."""
+    freqarray = np.array([430, 265, 300])
+    J = np.zeros((3, 3))
+    J[0, 1] = 7
+    J[0, 2] = 15
+    J[1, 2] = 1.5
+    J = J + J.T
+    return freqarray, J
+
+
+def test_mz_blocks():
+    blocks = mz_blocks(3)
+    assert [list(b) for b in blocks] == [[0], [1, 2, 4], [3, 5, 6], [7]]
+    assert sum(len(b) for b in mz_blocks(8)) == 256
+    assert max(len(b) for b in mz_blocks(8)) == 70  # C(8, 4)
+
+
+def test_blockdiag_eigh():
+    freqarray, J = rioux_system()
+    H = hamiltonian(freqarray, J)
+    E, V = blockdiag_eigh(H, 3)
+    np.testing.assert_array_almost_equal(E, np.linalg.eigvalsh(H))
+    np.testing.assert_array_almost_equal(np.asarray(H) @ V, V * E)
+
+
+def test_parallel_eigh():
+    rng = np.random.default_rng(0)
+    matrices = [rng.normal(size=(d, d)) for d in (3, 40, 1, 12)]
+    matrices = [m + m.T for m in matrices]
+    for threads in (1, 3, None):
+        solutions = parallel_eigh(matrices, threads)
+        for m, (E, V) in zip(matrices, solutions):
+            np.testing.assert_array_almost_equal(E, np.linalg.eigvalsh(m))
+            np.testing.assert_array_almost_equal(m @ V, V * E)
+
+    v = [100, 110, 150, 160, 300, 320]
+    J = np.full((6, 6), 7.0)
+    serial = nspinsignals(v, J)
+    threaded = nspinsignals(v, J, threads=4)
+    np.testing.assert_array_almost_equal(threaded[0], serial[0])
+    np.testing.assert_array_almost_equal(threaded[1], serial[1])
+
+
+def test_parallel_eigh_limits_blas(monkeypatch):
+    from contextlib import contextmanager
+    from secondorder.model import nmrmath
+
+    rng = np.random.default_rng(0)
+    matrices = [rng.normal(size=(d, d)) for d in (3, 4, 5, 6)]
+    matrices = [m + m.T for m in matrices]
+    limits = []
+
+    @contextmanager
+    def threadpool_limits(threads):
+        limits.append(threads)
+        yield
+
+    # with threadpoolctl, the small solves run on the pool with fewer BLAS
+    # threads each
+    monkeypatch.setattr(nmrmath, 'threadpool_limits', threadpool_limits)
+    monkeypatch.setattr(nmrmath.os, 'cpu_count', lambda: 8)
+    solutions = parallel_eigh(matrices, 4)
+    assert limits == [2]
+    for m, (E, V) in zip(matrices, solutions):
+        np.testing.assert_array_almost_equal(E, np.linalg.eigvalsh(m))
+
+    # without it, BLAS cannot be limited, so nothing runs on the pool
+    def no_pool(*args):
+        raise AssertionError('thread pool used without threadpoolctl')
+
+    monkeypatch.setattr(nmrmath, 'threadpool_limits', None)
+    monkeypatch.setattr(nmrmath, 'ThreadPoolExecutor', no_pool)
+    solutions = parallel_eigh(matrices, 4)
+    for m, (E, V) in zip(matrices, solutions):
+        np.testing.assert_array_almost_equal(E, np.linalg.eigvalsh(m))
+
+
+def kron_hamiltonian(freqs, couplings):
+    """Reference Hamiltonian from Kronecker products of spin operators"""
+    nspins = len(freqs)
+    pauli = [np.array([[0, 0.5], [0.5, 0]]),
+             np.array([[0, -0.5j], [0.5j, 0]]),
+             np.array([[0.5, 0], [0, -0.5]])]
+    L = [[None] * nspins for _ in pauli]
+    for axis, sigma in enumerate(pauli):
+        for n in range(nspins):
+            L[axis][n] = np.array([[1]])
+            for k in range(nspins):
+                L[axis][n] = np.kron(L[axis][n], sigma if k == n
+                                     else np.eye(2))
+    H = sum(freqs[n] * L[2][n] for n in range(nspins))
+    for n in range(nspins):
+        for k in range(nspins):
+            H = H + 0.5 * couplings[n, k] * sum(L[a][n] @ L[a][k]
+                                                for a in range(3))
+    return H.real
+
+
+def test_hamiltonian_bitwise():
+    freqarray, J = rioux_system()
+    H = kron_hamiltonian(freqarray, J)
+    np.testing.assert_array_almost_equal(hamiltonian_bitwise(freqarray, J), H)
+    H_sparse = hamiltonian_bitwise(freqarray, J, sparse=True)
+    np.testing.assert_array_almost_equal(H_sparse.toarray(), H)
+
+
+def test_transition_pairs():
+    lower, upper = transition_pairs(3)
+    assert len(lower) == 12
+    assert all(is_allowed(i, j) and i < j for i, j in zip(lower, upper))
+    assert transition_pairs(3) is transition_pairs(3)  # memoized
+
+
+def test_block_signals():
+    freqarray, J = rioux_system()
+    H = hamiltonian_bitwise(freqarray, J)
+    v, I = block_signals(mz_eigensystems(H, 3), 3)
+    assert isinstance(v, np.ndarray) and isinstance(I, np.ndarray)
+    assert len(v) == len(I) == 12
+    # With no cutoff, the total intensity equals the number of allowed
+    # basis-state transitions
+    v, I = block_signals(mz_eigensystems(H, 3), 3, cutoff=0)
+    assert I.sum() == approx(12)
+    v, I = block_signals(mz_eigensystems(H, 3), 3, cutoff=1.0)
+    assert np.all(I > 1.0)
+
+
+def test_spin_clusters():
+    J = np.zeros((5, 5))
+    J[0, 3] = J[3, 0] = 7
+    J[1, 4] = J[4, 1] = -12
+    clusters = spin_clusters(J)
+    assert [list(c) for c in clusters] == [[0, 3], [1, 4], [2]]
+
+
+def test_nspinspec_clusters():
+    """Disconnected clusters give the same lineshape as the full system"""
+    freqarray, J3 = rioux_system()
+    freqs = np.concatenate((freqarray, [100, 150]))
+    J = np.zeros((5, 5))
+    J[:3, :3] = J3
+    J[3, 4] = J[4, 3] = 8
+    x = np.linspace(50, 500, 2000)
+    clustered = nspinspec(freqs, J, cutoff=0)
+    full = simsignals(hamiltonian(freqs, J), 5, cutoff=0)
+    assert len(clustered) < len(full)
+    y_clustered = sum(I / (1 + (x - v) ** 2) for v, I in clustered)
+    y_full = sum(I / (1 + (x - v) ** 2) for v, I in full)
+    np.testing.assert_array_almost_equal(y_clustered, y_full)
+
+
+def ethyl_system():
+    """An A3B2X system (CH3-CH2-X) with 6 explicit nuclei."""
+    freqs = np.array([100, 100, 100, 130, 130, 200])
+    J = np.zeros((6, 6))
+    J[:3, 3:5] = 7
+    J[3:5, 5] = 3
+    J[:3, :3] = -12  # geminal couplings; do not affect the spectrum
+    J = np.triu(J, 1)
+    return freqs, J + J.T
+
+
+def test_total_spin_multiplicities():
+    assert total_spin_multiplicities(1) == [(0.5, 1)]
+    assert total_spin_multiplicities(2) == [(1, 1), (0, 1)]
+    assert total_spin_multiplicities(3) == [(1.5, 1), (0.5, 2)]
+
+
+def test_equivalent_groups():
+    freqs, J = ethyl_system()
+    groups = equivalent_groups(freqs, J)
+    assert [list(g) for g in groups] == [[0, 1, 2], [3, 4], [5]]
+    J[0, 3] = J[3, 0] = 6  # only nuclei 1 and 2 remain equivalent
+    groups = equivalent_groups(freqs, J)
+    assert [list(g) for g in groups] == [[0], [1, 2], [3], [4], [5]]
+
+
+def test_composite_signals():
+    """Composite particles give the same lineshape as all explicit nuclei"""
+    freqs, J = ethyl_system()
+    x = np.linspace(50, 250, 2000)
+    composite = composite_signals([100, 130, 200], [3, 2, 1],
+                                  J[np.ix_([0, 3, 5], [0, 3, 5])], cutoff=0)
+    full = nspinspec(freqs, J, cutoff=0, equivalence=False)
+    assert len(composite[0]) < len(full)
+    y_composite = sum(I / (1 + (x - v) ** 2) for v, I in zip(*composite))
+    y_full = sum(I / (1 + (x - v) ** 2) for v, I in full)
+    np.testing.assert_array_almost_equal(y_composite, y_full)
+
+
+def test_spin_basis():
+    basis = spin_basis(3)
+    assert spin_basis(3) is basis
+    assert basis.mz.shape == (8, 3)
+    assert not basis.mz.flags.writeable
+    assert list(basis.weight) == [popcount(i) for i in range(8)]
+    rows, cols = basis.flipflops[0, 2]
+    assert all(popcount(r ^ c) == 2 for r, c in zip(rows, cols))
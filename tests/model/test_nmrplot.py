@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from pytest import approx
 from secondorder.model import nmrplot
 from .accepted_data import ADD_SIGNALS_DATASET
@@ -27,3 +28,81 @@ def test_add_signals():
 
     assert np.array_equal(x, X)
     assert np.array_equal(y, Y)
+
+
+def test_add_signals_windowed():
+    rng = np.random.default_rng(0)
+    peaks = list(zip(rng.uniform(0, 500, 300), rng.uniform(0, 1, 300)))
+    x = np.linspace(-20, 520, 3000)
+    for w in (0.05, 0.5, 5):
+        exact = nmrplot.add_signals(x, peaks, w)
+        windowed = nmrplot.add_signals_windowed(x, peaks, w)
+        corrected = nmrplot.add_signals_windowed(x, peaks, w, tail=True)
+        # each missing tail is < I / (4 * widths**2)
+        assert np.all(windowed <= exact + 1e-12)
+        assert np.max(exact - windowed) < 300 / (4 * 50 ** 2)
+        assert np.max(np.abs(corrected - exact)) < 1e-4 * np.max(exact)
+    # a window covering the whole grid is exact
+    np.testing.assert_allclose(
+        nmrplot.add_signals_windowed(x, peaks, 20, widths=100),
+        nmrplot.add_signals(x, peaks, 20))
+
+
+def test_add_signals_windowed_tail_grid():
+    x = np.array([0.0, 1.0, 3.0])
+    with pytest.raises(ValueError):
+        nmrplot.add_signals_windowed(x, [(1, 1)], 0.5, tail=True)
+
+
+def test_add_signals_fft():
+    x = np.linspace(390, 410, 200)
+    dx = x[1] - x[0]
+    peaks = [(399.03, 1), (401.71, 0.5), (415, 2)]  # the last beyond the grid
+    for w in (0.5, 2):
+        exact = nmrplot.add_signals(x, peaks, w)
+        bounds = {'nearest': 0.75 * dx / w,
+                  'linear': (dx / w) ** 2,
+                  'taylor': 2.5 * (dx / w) ** 3}
+        for placement, bound in bounds.items():
+            y = nmrplot.add_signals_fft(x, peaks, w, placement)
+            assert np.max(np.abs(y - exact)) <= 3.5 * bound
+
+    gaussians = sum(nmrplot.gaussian(x, v, I, 2) for v, I in peaks)
+    y = nmrplot.add_signals_fft(x, peaks, 2, 'taylor', 'gaussian')
+    assert np.max(np.abs(y - gaussians)) <= 3.5 * 2.5 * (dx / 2) ** 3
+
+    with pytest.raises(ValueError):
+        nmrplot.add_signals_fft(x, peaks, 1, placement='cubic')
+    with pytest.raises(ValueError):
+        nmrplot.add_signals_fft(x, peaks, 1, shape='voigt')
+
+
+def test_tkplot_grid():
+    doublet = [(399, 1), (401, 1)]
+    for w in (0.01, 0.5, 2):
+        x, y = nmrplot.tkplot(list(doublet), w)
+        assert x[0] <= 399 - 50 and x[-1] >= 401 + 50
+        # narrow lines are sampled at their tops and half heights
+        top = nmrplot.add_signals(np.array([399.0]), doublet, w)[0]
+        assert y.max() == approx(top, rel=1e-3)
+        exact = nmrplot.add_signals(x, doublet, w)
+        assert np.max(np.abs(y - exact)) < 1e-3
+
+    x, _ = nmrplot.tkplot(list(doublet), 50)
+    assert len(x) < 2400  # wide lines need fewer points
+    assert x[0] <= 399 - 500
+
+    x, y = nmrplot.tkplot(list(doublet), 0.01, points=1000)
+    assert len(x) == len(y) == 1000
+    np.testing.assert_allclose(np.diff(x), np.diff(x)[0])
+
+
+def test_tkplot_limits():
+    spectrum = [(399, 1), (401, 1), (900, 1)]
+    for w in (0.01, 0.5, 50):
+        x, y = nmrplot.tkplot(list(spectrum), w, pixels=800,
+                              limits=(405, 395))
+        assert x[0] == 395 and x[-1] == 405
+        assert len(x) <= 800 + len(spectrum) * len(nmrplot.PEAK_STENCIL)
+        exact = nmrplot.add_signals(x, spectrum, w)
+        assert np.max(np.abs(y - exact)) < 1e-3 * np.max(exact)
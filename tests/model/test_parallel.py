@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+from secondorder.model.nmrmath import nspinsignals
+from secondorder.model.parallel import (START_METHOD, ParallelSimulator,
+                                        blas_environment)
+
+
+def test_blas_environment():
+    saved = os.environ.get('OMP_NUM_THREADS')
+    with blas_environment(2):
+        assert os.environ['OMP_NUM_THREADS'] == '2'
+    assert os.environ.get('OMP_NUM_THREADS') == saved
+    # workers must start a new interpreter to read the environment
+    assert START_METHOD != 'fork'
+    assert ParallelSimulator().context.get_start_method() == START_METHOD
+
+
+def test_parallel_simulator():
+    systems = []
+    for n in (2, 3, 4):
+        v = np.linspace(100, 200, n)
+        J = np.full((n, n), 7.0) - 7.0 * np.eye(n)
+        systems.append((v, J))
+    with ParallelSimulator(workers=2) as simulator:
+        frequencies, intensities, offsets = simulator.simulate(systems)
+    assert len(offsets) == 4
+    for b, (v, J) in enumerate(systems):
+        reference = nspinsignals(v, J)
+        peaks = slice(offsets[b], offsets[b + 1])
+        np.testing.assert_array_equal(frequencies[peaks], reference[0])
+        np.testing.assert_array_equal(intensities[peaks], reference[1])
+
+
+def test_parallel_simulator_chunks():
+    rng = np.random.default_rng(0)
+    systems = []
+    for n in (2, 3, 4, 3, 2, 5, 1):
+        J = rng.uniform(0, 15, (n, n))
+        J = J + J.T
+        np.fill_diagonal(J, 0)
+        systems.append((rng.uniform(100, 500, n), J))
+    with ParallelSimulator(workers=2, chunksize=3) as simulator:
+        frequencies, intensities, offsets = simulator.simulate(systems)
+        empty = simulator.simulate([])
+    for b, (v, J) in enumerate(systems):
+        reference = nspinsignals(v, J)
+        peaks = slice(offsets[b], offsets[b + 1])
+        np.testing.assert_array_equal(frequencies[peaks], reference[0])
+        np.testing.assert_array_equal(intensities[peaks], reference[1])
+    assert len(empty[0]) == 0 and list(empty[2]) == [0]
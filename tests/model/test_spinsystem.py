@@ -0,0 +1,75 @@
+import numpy as np
+from secondorder.model.nmrmath import hamiltonian_bitwise, nspinspec
+from secondorder.model.spinsystem import SpinSystem, perturbed_eigh
+
+
+def abcd_system():
+    v = np.array([105, 140, 180, 205])
+    J = np.zeros((4, 4))
+    J[0, 1] = -12
+    J[0, 2] = 6
+    J[0, 3] = 8
+    J[1, 2] = 3
+    J[1, 3] = 3
+    return v, J + J.T
+
+
+def assert_blocks_match(system, v, J):
+    H = hamiltonian_bitwise(v, J)
+    for indices, H_block in system.hamiltonian_blocks():
+        np.testing.assert_array_almost_equal(H_block,
+                                             H[np.ix_(indices, indices)])
+
+
+def test_spinsystem_updates():
+    v, J = abcd_system()
+    system = SpinSystem(v, J)
+    assert_blocks_match(system, v, J)
+
+    system.set_frequency(2, 170)
+    v[2] = 170
+    assert_blocks_match(system, v, J)
+
+    system.set_coupling(3, 2, 4.5)
+    J[2, 3] = J[3, 2] = 4.5
+    assert_blocks_match(system, v, J)
+
+    v[0] = 100
+    J[0, 1] = J[1, 0] = -14
+    system.update(v, J)
+    assert_blocks_match(system, v, J)
+    system.rebuild()
+    assert_blocks_match(system, v, J)
+
+
+def test_spinsystem_spectrum():
+    v, J = abcd_system()
+    np.testing.assert_array_almost_equal(sorted(SpinSystem(v, J).spectrum()),
+                                         sorted(nspinspec(v, J)))
+
+
+def test_perturbed_eigh():
+    v, J = abcd_system()
+    H = hamiltonian_bitwise(v, J)
+    E, V = np.linalg.eigh(H)
+    v[1] += 0.05
+    H_new = hamiltonian_bitwise(v, J)
+    E_new, V_new = perturbed_eigh(H_new, E, V, tolerance=0.01)
+    np.testing.assert_array_almost_equal(E_new, np.linalg.eigvalsh(H_new))
+    np.testing.assert_array_almost_equal(V_new.T @ H_new @ V_new,
+                                         np.diag(E_new), decimal=4)
+    v[1] += 20
+    assert perturbed_eigh(hamiltonian_bitwise(v, J), E, V, 0.01) is None
+
+
+def test_spinsystem_warm_start():
+    v, J = abcd_system()
+    system = SpinSystem(v, J, tolerance=0.01)
+    system.spectrum()
+    for step in range(5):
+        v[0] += 0.1
+        system.update(v, J)
+        np.testing.assert_array_almost_equal(sorted(system.spectrum()),
+                                             sorted(nspinspec(v, J)),
+                                             decimal=3)
+    assert system.warm_solves > 0
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+from secondorder.model.store import (SpectrumStore, canonical_key,
+                                     canonical_spinsystem)
+
+
+def abc_system():
+    v = np.array([115, 140, 190])
+    j = np.zeros((3, 3))
+    j[0, 1] = 6
+    j[0, 2] = 12
+    j[1, 2] = 3
+    return v, j + j.T
+
+
+def test_canonical_key_permutation():
+    v, j = abc_system()
+    order = [2, 0, 1]
+    assert (canonical_key(v[order], j[np.ix_(order, order)])
+            == canonical_key(v, j))
+    assert canonical_key(v, j, 'a') != canonical_key(v, j, 'b')
+    v_canonical, _ = canonical_spinsystem(v[order], j[np.ix_(order, order)])
+    np.testing.assert_array_equal(v_canonical, [115, 140, 190])
+
+
+def test_spectrum_store(tmpdir):
+    store = SpectrumStore(str(tmpdir))
+    v, j = abc_system()
+    frequencies, intensities = store.nspinsignals(v, j)
+    assert len(store.entries()) == 1
+    # A permuted listing of the same system is read back from the store
+    order = [1, 2, 0]
+    cached = store.nspinsignals(v[order], j[np.ix_(order, order)])
+    np.testing.assert_array_equal(cached[0], frequencies)
+    np.testing.assert_array_equal(cached[1], intensities)
+    assert len(store.entries()) == 1
+    assert store.get('0' * 40) is None
+
+
+def test_spectrum_store_eviction(tmpdir):
+    store = SpectrumStore(str(tmpdir))
+    store.put('aa' + '0' * 38, np.zeros(1000), np.zeros(1000))
+    store.put('bb' + '0' * 38, np.ones(1000), np.ones(1000))
+    _, size, oldest = min(store.entries())
+    os.utime(oldest, (0, 0))
+    store.max_bytes = store.size() - 1
+    assert store.evict() == 1
+    assert len(store.entries()) == 1
+    assert not os.path.exists(oldest)
+
+
+def test_spectrum_store_put_evicts_oldest(tmpdir):
+    store = SpectrumStore(str(tmpdir), low_water=0.6)
+    frequencies, intensities = np.arange(100.0), np.ones(100)
+    keys = ['{:02x}'.format(i) + '0' * 38 for i in range(10)]
+    store.put(keys[0], frequencies, intensities)
+    store.max_bytes = 5 * store.size()  # room for 5 entries
+    os.utime(store.path(keys[0]), (0, 0))
+    for i, key in enumerate(keys[1:], 1):
+        store.put(key, frequencies, intensities)
+        os.utime(store.path(key), (i, i))  # ensure distinct use times
+        assert store.estimated_bytes == store.size()
+    # The 6th and 9th puts went over 5 entries, each evicting the 3 least
+    # recently used entries to get down to 60% of max_bytes.
+    remaining = sorted(os.path.basename(path)[:-len(store.suffix)]
+                       for _, _, path in store.entries())
+    assert remaining == keys[6:]
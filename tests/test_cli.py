@@ -0,0 +1,145 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pytest
+
+from secondorder import cli
+from secondorder.model.bulk import BulkReader
+from secondorder.model.nmrmath import nspinspec
+from secondorder.model.nmrplot import tkplot
+from secondorder.model.store import SpectrumStore
+
+SYSTEMS = [{'id': 'ab', 'v': [100, 120], 'j': [[0, 10], [10, 0]]},
+           {'id': 'abx', 'v': [100, 120, 300],
+            'j': [[0, 10, 5], [10, 0, 2], [5, 2, 0]], 'w': 1.0},
+           {'id': 'bad', 'v': [100, 120], 'j': [[0]]}]
+
+
+def run(tmp_path, *options):
+    source = tmp_path / 'systems.jsonl'
+    source.write_text('\n'.join(json.dumps(s) for s in SYSTEMS) + '\nnope\n')
+    target = tmp_path / 'out.jsonl'
+    status = cli.main([str(source), '-o', str(target), *options])
+    return status, [json.loads(line)
+                    for line in target.read_text().splitlines()]
+
+
+def test_cli_peaks(tmp_path):
+    for workers in ('0', '2'):
+        status, results = run(tmp_path, '--workers', workers,
+                              '--in-flight', '1')
+        assert status == 1  # two invalid lines
+        assert [r['id'] for r in results] == ['ab', 'abx', 'bad', None]
+        for system, result in zip(SYSTEMS[:2], results):
+            expected = nspinspec(np.array(system['v'], dtype=float),
+                                 np.array(system['j'], dtype=float))
+            np.testing.assert_allclose(result['peaks'], expected)
+        assert 'error' in results[2] and results[3]['line'] == 4
+
+
+def test_cli_lineshape(tmp_path):
+    status, results = run(tmp_path, '--workers', '0', '--lineshape',
+                          '--points', '100', '--store', str(tmp_path / 'db'))
+    system = SYSTEMS[1]
+    x, y = tkplot(nspinspec(system['v'], np.array(system['j'])), 1.0,
+                  points=100)
+    np.testing.assert_allclose(results[1]['x'], x)
+    np.testing.assert_allclose(results[1]['y'], y)
+    assert len(results[0]['x']) == 100
+
+
+def test_cli_bulk(tmp_path):
+    status, results = run(tmp_path, '--workers', '0', '--points', '300',
+                          '--bulk', str(tmp_path / 'bulk'))
+    assert status == 1
+    assert results[:2] == [{'id': 'ab', 'row': 0}, {'id': 'abx', 'row': 1}]
+    stored = BulkReader(tmp_path / 'bulk')
+    assert stored.spectra.shape == (2, 300)
+    system = SYSTEMS[1]
+    peaklist = nspinspec(system['v'], np.array(system['j']))
+    np.testing.assert_allclose(stored.peaklist('abx'), peaklist)
+    x, y = stored.spectrum('abx')
+    x_expected, y_expected = tkplot(list(peaklist), 1.0, points=300)
+    np.testing.assert_allclose(x, x_expected)
+    np.testing.assert_allclose(y, y_expected)
+
+
+def test_cli_invalid_values():
+    def reject(constant):
+        raise ValueError('non-standard JSON: ' + constant)
+
+    ab = '"v": [100, 120], "j": [[0, 10], [10, 0]]'
+    for line in ('{' + ab + ', "w": 0}',
+                 '{' + ab + ', "w": -1}',
+                 '{' + ab + ', "w": NaN}',
+                 '{"v": [100, Infinity], "j": [[0, 10], [10, 0]]}',
+                 '{"v": [100, 120], "j": [[0, NaN], [NaN, 0]]}'):
+        text, error = cli.process_line((1, line), lineshape=True)
+        assert error.startswith('ValueError')
+        assert 'error' in json.loads(text, parse_constant=reject)
+
+
+def test_cli_bulk_ids(tmp_path):
+    ab = {'v': [100, 120], 'j': [[0, 10], [10, 0]]}
+    source = tmp_path / 'systems.jsonl'
+    # an integer ID equal to the line number of a system without an ID
+    source.write_text(json.dumps(ab) + '\n' + json.dumps(dict(ab, id=1)))
+    bulk = tmp_path / 'bulk'
+    status = cli.main([str(source), '-o', str(tmp_path / 'out.jsonl'),
+                       '--workers', '0', '--points', '50', '--bulk',
+                       str(bulk), '--flush-every', '1'])
+    assert status == 0
+    assert BulkReader(bulk).ids == ['line:1', 1]
+
+
+def test_cli_store_listed_once(tmp_path, monkeypatch):
+    listings = []
+    entries = SpectrumStore.entries
+    monkeypatch.setattr(SpectrumStore, 'entries',
+                        lambda self: listings.append(1) or entries(self))
+    source = tmp_path / 'systems.jsonl'
+    source.write_text('\n'.join(
+        json.dumps({'v': [100 + n, 120], 'j': [[0, 10], [10, 0]]})
+        for n in range(20)))
+    status = cli.main([str(source), '-o', str(tmp_path / 'out.jsonl'),
+                       '--workers', '0', '--store', str(tmp_path / 'db')])
+    assert status == 0
+    assert len(SpectrumStore(tmp_path / 'db').entries()) == 20
+    assert len(listings) == 2  # the first put, and the check above
+
+
+def test_cli_max_cluster():
+    n = 6
+    j = (np.full((n, n), 7.0) - 7.0 * np.eye(n)).tolist()
+    record = {'v': list(range(100, 100 + 10 * n, 10)), 'j': j}
+    with pytest.raises(ValueError):
+        cli.simulate_record(record, max_cluster=5)
+    cli.simulate_record(record, max_cluster=6)
+    # first order is cheap for any number of spins
+    cli.simulate_record(dict(record, simulation='FO'), max_cluster=2)
+
+
+def test_cli_memory_error(monkeypatch):
+    def out_of_memory(v, j):
+        raise MemoryError('cannot allocate')
+
+    monkeypatch.setitem(cli.SIMULATIONS, 'FO', out_of_memory)
+    line = json.dumps(dict(SYSTEMS[0], simulation='FO'))
+    text, error = cli.process_line((7, line))
+    assert error.startswith('MemoryError')
+    assert json.loads(text)['line'] == 7
+
+
+def square_or_die(n):
+    if n == 3:
+        os._exit(1)  # as if killed for using too much memory
+    return n * n
+
+
+def test_bounded_map_worker_dies():
+    results = cli.bounded_map(partial(ProcessPoolExecutor, 2), square_or_die,
+                              range(8), 4, lambda n, error: ('died', n))
+    assert list(results) == [0, 1, 4, ('died', 3), 16, 25, 36, 49]